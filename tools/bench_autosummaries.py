@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""Show how write_autosummaries() scales with the size of a doctree.
+
+Synthetic API doctrees are built at increasing sizes (nested sections,
+each holding classes with members, functions and attributes), and the
+time per node is printed; it should stay flat as the tree grows.
+
+With ``--against``, the implementation from an earlier git revision is
+timed as well, and both are checked to produce identical doctrees::
+
+    python tools/bench_autosummaries.py --against HEAD~1
+
+"""
+
+import argparse
+import gc
+import os
+import subprocess
+import time
+import types
+
+from docutils import nodes
+from docutils.frontend import get_default_settings
+from docutils.parsers.rst import Parser
+from docutils.utils import new_document
+from sphinx import addnodes
+
+from zzzeeksphinx import autodoc_mods
+
+
+def _desc(objtype, fullname, members=()):
+    sig = addnodes.desc_signature(
+        "", "", ids=["mod.%s" % fullname], fullname=fullname
+    )
+    sig += addnodes.desc_addname("mod.", "mod.")
+    sig += addnodes.desc_name(fullname, fullname.split(".")[-1])
+    content = addnodes.desc_content()
+    content += nodes.paragraph("", "", nodes.Text("Describes %s." % fullname))
+    content += nodes.paragraph("", "", nodes.Text("More text."))
+    for member in members:
+        content += member
+    return addnodes.desc("", sig, content, objtype=objtype, domain="py")
+
+
+def _section(prefix, depth, fanout, classes, members):
+    section = nodes.section("", ids=["section-%s" % prefix])
+    section += nodes.title("", "Section %s" % prefix)
+    section += nodes.paragraph("", "", nodes.Text("Some intro text."))
+    for num in range(classes):
+        name = "Class_%s_%d" % (prefix, num)
+        section += _desc(
+            "class",
+            name,
+            [
+                _desc(
+                    ("method", "attribute", "classmethod")[mnum % 3],
+                    "%s.member_%d" % (name, mnum),
+                )
+                for mnum in range(members)
+            ],
+        )
+        section += _desc("function", "function_%s_%d" % (prefix, num))
+        section += _desc("data", "data_%s_%d" % (prefix, num))
+    if depth > 1:
+        for num in range(fanout):
+            section += _section(
+                "%s_%d" % (prefix, num), depth - 1, fanout, classes, members
+            )
+    return section
+
+
+def make_doctree(depth, fanout, classes, members):
+    doctree = new_document("<bench>", get_default_settings(Parser))
+    doctree += _section("0", depth, fanout, classes, members)
+    return doctree
+
+
+def _count(doctree):
+    return sum(1 for _ in doctree.findall(nodes.Element))
+
+
+def _load_revision(rev):
+    source = subprocess.check_output(
+        ["git", "show", "%s:zzzeeksphinx/autodoc_mods.py" % rev],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    module = types.ModuleType("autodoc_mods_%s" % rev)
+    exec(compile(source, module.__name__, "exec"), module.__dict__)
+    return module
+
+
+def _time(write_autosummaries, args, repeat):
+    app = types.SimpleNamespace(
+        env=types.SimpleNamespace(
+            docname="bench",
+            config=types.SimpleNamespace(
+                zzzeeksphinx_autosummary_max_length=0
+            ),
+        )
+    )
+    best = None
+    for _ in range(repeat):
+        doctree = make_doctree(*args)
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            write_autosummaries(app, doctree)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, doctree
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--depths",
+        default="2,3,4,5,6",
+        help="comma separated section nesting depths to try",
+    )
+    parser.add_argument("--fanout", type=int, default=2)
+    parser.add_argument("--classes", type=int, default=3)
+    parser.add_argument("--members", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--against", help="git revision of write_autosummaries to compare"
+    )
+    args = parser.parse_args(argv)
+
+    against = _load_revision(args.against) if args.against else None
+
+    header = "%6s %9s %10s %10s" % ("depth", "nodes", "time(s)", "us/node")
+    if against:
+        header += " %10s %10s" % (args.against, "us/node")
+    print(header)
+    print("-" * len(header))
+
+    for depth in [int(d) for d in args.depths.split(",")]:
+        tree_args = (depth, args.fanout, args.classes, args.members)
+        count = _count(make_doctree(*tree_args))
+        elapsed, doctree = _time(
+            autodoc_mods.write_autosummaries, tree_args, args.repeat
+        )
+        line = "%6d %9d %10.3f %10.2f" % (
+            depth,
+            count,
+            elapsed,
+            elapsed / count * 1e6,
+        )
+        if against:
+            against_elapsed, against_doctree = _time(
+                against.write_autosummaries, tree_args, args.repeat
+            )
+            line += " %10.3f %10.2f" % (
+                against_elapsed,
+                against_elapsed / count * 1e6,
+            )
+            if doctree.pformat() != against_doctree.pformat():
+                line += "  OUTPUT DIFFERS"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,603 @@
+#!/usr/bin/env python
+"""Time the zzzeeksphinx extension hooks against a synthetic project.
+
+A throwaway Sphinx project is generated (pages, autodoc'ed classes,
+SQL code blocks, dialect directives, nested toctrees), built with the
+full ``zzzeeksphinx`` extension, and the time spent inside each hook is
+recorded.  The result is written as JSON so that reports from two
+releases can be compared::
+
+    python tools/bench_hooks.py --output before.json
+    # ... change things ...
+    python tools/bench_hooks.py --output after.json --compare before.json
+
+Builds are serial, as hooks running in forked reader / writer processes
+can't be timed from here, and each repeat is a cold build into a fresh
+output directory.
+
+"""
+
+import argparse
+import collections
+import functools
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import sphinx
+from sphinx.application import Sphinx
+from sphinx.util.docutils import docutils_namespace
+
+from zzzeeksphinx import __version__
+from zzzeeksphinx import autodoc_mods
+from zzzeeksphinx import dialect_info
+from zzzeeksphinx import doctree_visitor
+from zzzeeksphinx import extras
+from zzzeeksphinx import render_pydomains
+from zzzeeksphinx import scss
+from zzzeeksphinx import sqlformatter
+from zzzeeksphinx import toc
+
+# (report name, owner, attribute, doctree-read mode or None for either)
+#
+# process_doctree() runs either the single pass DoctreeReadVisitor,
+# which calls the per-node functions directly, or the four original
+# doctree-read functions, as zzzeeksphinx_single_pass_doctree_read
+# says; only those of the mode in use are timed
+HOOKS = [
+    ("process_doctree", doctree_visitor, "process_doctree", None),
+    (
+        "fix_up_autodoc_header",
+        autodoc_mods,
+        "fix_up_autodoc_header",
+        "single pass",
+    ),
+    (
+        "write_autosummary_tables",
+        autodoc_mods,
+        "write_autosummary_tables",
+        "single pass",
+    ),
+    (
+        "synonyms.replace",
+        render_pydomains._SynonymReplacer,
+        "replace",
+        "single pass",
+    ),
+    ("move_footers", extras, "move_footers", "single pass"),
+    ("write_autosummaries", autodoc_mods, "write_autosummaries", "legacy"),
+    (
+        "fix_up_autodoc_headers",
+        autodoc_mods,
+        "fix_up_autodoc_headers",
+        "legacy",
+    ),
+    ("replace_synonyms", render_pydomains, "replace_synonyms", "legacy"),
+    ("move_footer", extras, "move_footer", "legacy"),
+    ("process_dialect_table", dialect_info, "process_dialect_table", None),
+    ("get_current_subtoc", toc.TOCMixin, "get_current_subtoc", None),
+    ("get_local_toc", toc.TOCMixin, "get_local_toc", None),
+    ("PopupSQLFormatter", sqlformatter.PopupSQLFormatter, "format", None),
+    ("generate_stylesheet", scss, "generate_stylesheet", None),
+]
+
+
+# hooks that only run when the project has some of these
+HOOK_REQUIRES = {
+    "fix_up_autodoc_header": "classes",
+    "PopupSQLFormatter": "code_blocks",
+}
+
+
+def _doctree_read_mode(overrides):
+    if overrides.get("zzzeeksphinx_single_pass_doctree_read", True):
+        return "single pass"
+    else:
+        return "legacy"
+
+
+def _hooks(mode):
+    return [
+        (name, owner, attr)
+        for name, owner, attr, hook_mode in HOOKS
+        if hook_mode in (None, mode)
+    ]
+
+
+PACKAGE = "benchlib"
+
+CONF = """\
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath("src"))
+
+extensions = ["sphinx.ext.autodoc", "zzzeeksphinx"]
+html_theme = "zzzeeksphinx"
+project = "bench"
+version = release = "1.0"
+release_date = "today"
+html_domain_indices = False
+autodocmods_convert_modname = {"%(package)s.base": "%(package)s"}
+zzzeeksphinx_module_prefixes = {"_bl": "%(package)s"}
+"""
+
+CLASS = '''
+
+class Thing%(num)d(object):
+    """A thing, related to :class:`.Thing%(other)d` and produced by
+    :func:`.make_thing%(num)d`; the ``name`` given is stored in
+    :attr:`.Thing%(num)d.name`, *emphasized* where **needed**, and
+    passed along to :meth:`.Thing%(other)d.where` on each call.
+
+    See also :meth:`_bl.Thing%(other)d.select` and
+    :func:`.make_thing%(other)d`.
+
+    """
+
+    name = None
+    """The name of the :class:`.Thing%(num)d`."""
+
+    def select(self, *entities: int) -> "Thing%(num)d":
+        """Return a new :class:`.Thing%(num)d`.
+
+        Refer to :attr:`.Thing%(num)d.name`.
+
+        """
+
+    def where(self, criteria, **kw):
+        """Apply criteria to this :class:`.Thing%(num)d`."""
+
+    @classmethod
+    def create(cls, name):
+        """Create a :class:`.Thing%(num)d` by name."""
+
+    async def run(self):
+        """Run the :class:`.Thing%(num)d`."""
+
+
+def make_thing%(num)d(name: str) -> Thing%(num)d:
+    """Produce a :class:`.Thing%(num)d`."""
+'''
+
+CODE_BLOCK = """
+.. sourcecode:: pycon+sql
+
+    >>> from %(package)s import Thing%(num)d
+    >>> stmt = Thing%(num)d().select(1).where(x == 5)
+    >>> with engine.connect() as conn:
+    ...     result = conn.execute(stmt)
+    {execsql}BEGIN (implicit)
+    SELECT thing.id, thing.name
+    FROM thing
+    WHERE thing.x = ?
+    [...] (5,){stop}
+    >>> print(result.all())
+    [(1, 'one'), (2, 'two')]
+
+.. sourcecode:: python+sql
+
+    {sql}result = session.execute(
+        select(Thing%(num)d).where(Thing%(num)d.name == "x")
+    )
+    SELECT thing.id, thing.name FROM thing WHERE thing.name = ?
+    {stop}
+    for row in result:
+        print(row)
+"""
+
+
+def _page_parents(pages, depth):
+    """Arrange pages 1..N into a tree roughly ``depth`` levels deep;
+    page 0 is the root index."""
+
+    branch = max(2, int(round(pages ** (1.0 / max(depth, 1)) + 0.5)))
+    return {num: (num - 1) // branch for num in range(1, pages + 1)}
+
+
+def write_project(root, pages, classes, code_blocks, dialects, depth):
+    src = os.path.join(root, "src", PACKAGE)
+    os.makedirs(src)
+    with open(os.path.join(root, "conf.py"), "w") as file_:
+        file_.write(CONF % {"package": PACKAGE})
+
+    with open(os.path.join(src, "__init__.py"), "w") as file_:
+        file_.write("from .base import *  # noqa\n")
+    with open(os.path.join(src, "base.py"), "w") as file_:
+        for num in range(classes):
+            file_.write(CLASS % {"num": num, "other": (num + 1) % classes})
+
+    parents = _page_parents(pages, depth)
+    children = collections.defaultdict(list)
+    for num, parent in parents.items():
+        children[parent].append(num)
+
+    class_pages = collections.defaultdict(list)
+    for num in range(classes):
+        class_pages[1 + num % pages].append(num)
+
+    for num in range(pages + 1):
+        fname = "index.rst" if num == 0 else "page%d.rst" % num
+        title = "Bench" if num == 0 else "Page %d" % num
+        out = [title, "=" * len(title), ""]
+        if num == 0 and dialects:
+            out.extend(
+                [
+                    ".. dialect-table:: **Supported database versions**",
+                    "",
+                    ".. glossary::",
+                    "",
+                    "    Supported version",
+                    "        A supported version.",
+                    "",
+                    "    Best effort",
+                    "        A version supported on a best effort basis.",
+                    "",
+                ]
+            )
+
+        if children[num]:
+            out.extend([".. toctree::", "   :maxdepth: %d" % depth, ""])
+            out.extend("   page%d" % child for child in children[num])
+            if num == 0 and dialects:
+                out.extend("   dialect%d" % d for d in range(dialects))
+            out.append("")
+
+        for section in range(3):
+            heading = "Section %d.%d" % (num, section)
+            out.extend([heading, "-" * len(heading), ""])
+            out.append(
+                "Refers to :class:`.Thing%d`, :meth:`_bl.Thing%d.select` "
+                "and :func:`.make_thing%d`."
+                % ((num, num, num) if num < classes else (0, 0, 0))
+            )
+            out.append("")
+            subheading = "Subsection %d.%d" % (num, section)
+            out.extend([subheading, "~" * len(subheading), ""])
+            for block in range(code_blocks):
+                out.append(
+                    CODE_BLOCK % {"package": PACKAGE, "num": block % classes}
+                )
+
+        if class_pages.get(num):
+            out.extend(
+                ["API", "---", "", ".. currentmodule:: %s" % PACKAGE, ""]
+            )
+            for cls in class_pages[num]:
+                out.extend(
+                    [
+                        ".. autoclass:: Thing%d" % cls,
+                        "    :members:",
+                        "",
+                        ".. autofunction:: make_thing%d" % cls,
+                        "",
+                    ]
+                )
+
+        out.extend(
+            [".. footer_topic:: Footer", "", "    a footer for page.", ""]
+        )
+        with open(os.path.join(root, fname), "w") as file_:
+            file_.write("\n".join(out))
+
+    for num in range(dialects):
+        title = "Dialect %d" % num
+        with open(os.path.join(root, "dialect%d.rst" % num), "w") as file_:
+            file_.write(
+                "\n".join(
+                    [
+                        title,
+                        "=" * len(title),
+                        "",
+                        ".. dialect:: db%d" % num,
+                        "    :name: Database%d" % num,
+                        "    :normal_support: %d.0+" % (num + 1),
+                        "    :best_effort: %d.0+" % num,
+                        "",
+                        "Driver",
+                        "------",
+                        "",
+                        ".. dialect:: db%d+driver" % num,
+                        "    :name: driver%d" % num,
+                        "    :url: https://example.com/driver%d" % num,
+                        "    :connectstring: db%d+driver://u:p@host/db" % num,
+                        "",
+                    ]
+                )
+            )
+
+
+class HookTimer:
+    def __init__(self, hooks):
+        self.hooks = hooks
+        self.timings = collections.defaultdict(list)
+        self._originals = []
+
+    def _wrap(self, name, fn):
+        timings = self.timings[name]
+
+        @functools.wraps(fn)
+        def timed(*arg, **kw):
+            start = time.perf_counter()
+            try:
+                return fn(*arg, **kw)
+            finally:
+                timings.append(time.perf_counter() - start)
+
+        return timed
+
+    def install(self):
+        # hooks are looked up as module globals when zzzeeksphinx.setup()
+        # connects them, so these have to be in place before the app
+        # is created
+        for name, owner, attr in self.hooks:
+            self._originals.append((owner, attr, owner.__dict__.get(attr)))
+            setattr(owner, attr, self._wrap(name, getattr(owner, attr)))
+
+    def uninstall(self):
+        for owner, attr, fn in self._originals:
+            if fn is None:
+                # was inherited, e.g. PopupSQLFormatter.format
+                delattr(owner, attr)
+            else:
+                setattr(owner, attr, fn)
+        self._originals[:] = []
+
+
+def _doctree_bytes(doctreedir):
+    return sum(
+        os.path.getsize(os.path.join(dirpath, fname))
+        for dirpath, _, fnames in os.walk(doctreedir)
+        for fname in fnames
+        if fname.endswith(".doctree")
+    )
+
+
+def run_build(root, outdir, overrides, hooks):
+    timer = HookTimer(hooks)
+    warnings = io.StringIO()
+    timer.install()
+    try:
+        with docutils_namespace():
+            start = time.perf_counter()
+            app = Sphinx(
+                root,
+                root,
+                os.path.join(outdir, "html"),
+                os.path.join(outdir, "doctrees"),
+                "html",
+                status=None,
+                warning=warnings,
+                freshenv=True,
+                confoverrides=overrides,
+            )
+            app.build()
+            total = time.perf_counter() - start
+    finally:
+        timer.uninstall()
+    return (
+        total,
+        timer.timings,
+        warnings.getvalue(),
+        _doctree_bytes(os.path.join(outdir, "doctrees")),
+    )
+
+
+def _summarize(timings):
+    return {
+        "calls": len(timings),
+        "total": sum(timings),
+        "mean": sum(timings) / len(timings) if timings else 0.0,
+        "max": max(timings) if timings else 0.0,
+    }
+
+
+def _overrides(defines):
+    overrides = {}
+    for define in defines:
+        name, _, value = define.partition("=")
+        overrides[name] = int(value) if value.isdigit() else value
+    return overrides
+
+
+def run(args):
+    overrides = _overrides(args.define)
+    mode = _doctree_read_mode(overrides)
+    hooks = _hooks(mode)
+    root = tempfile.mkdtemp(prefix="zzzeeksphinx_bench_")
+    try:
+        write_project(
+            root,
+            args.pages,
+            args.classes,
+            args.code_blocks,
+            args.dialects,
+            args.depth,
+        )
+        runs = []
+        for num in range(args.repeat):
+            runs.append(
+                run_build(
+                    root,
+                    os.path.join(root, "_build%d" % num),
+                    overrides,
+                    hooks,
+                )
+            )
+    finally:
+        sys.path[:] = [p for p in sys.path if not p.startswith(root)]
+        sys.modules.pop(PACKAGE, None)
+        sys.modules.pop(PACKAGE + ".base", None)
+        shutil.rmtree(root)
+
+    # report the fastest repeat for each figure
+    summaries = {}
+    for name, owner, attr in hooks:
+        summaries[name] = min(
+            (_summarize(timings[name]) for _, timings, _, _ in runs),
+            key=lambda summary: summary["total"],
+        )
+
+    return {
+        "zzzeeksphinx": __version__,
+        "sphinx": sphinx.__display_version__,
+        "python": platform.python_version(),
+        "project": {
+            "pages": args.pages,
+            "classes": args.classes,
+            "code_blocks": args.code_blocks,
+            "dialects": args.dialects,
+            "depth": args.depth,
+            "overrides": overrides,
+        },
+        "repeat": args.repeat,
+        "total": min(run[0] for run in runs),
+        "warnings": len(runs[0][2].splitlines()),
+        "doctree_bytes": runs[0][3],
+        "doctree_read": mode,
+        "hooks": summaries,
+    }
+
+
+def uncalled_hooks(report):
+    """Hooks that were never called, though the project should have
+    exercised them; their timings mean nothing."""
+
+    return [
+        name
+        for name, summary in report["hooks"].items()
+        if not summary["calls"]
+        and report["project"].get(HOOK_REQUIRES.get(name), 1)
+    ]
+
+
+def print_report(report, compare=None):
+    print(
+        "zzzeeksphinx %s, sphinx %s, python %s"
+        % (report["zzzeeksphinx"], report["sphinx"], report["python"])
+    )
+    print(
+        "project: %s"
+        % ", ".join("%s=%s" % item for item in report["project"].items())
+    )
+    print(
+        "doctree-read: %s (zzzeeksphinx_single_pass_doctree_read)"
+        % report["doctree_read"]
+    )
+    header = "%-24s %8s %10s %10s %10s" % (
+        "hook",
+        "calls",
+        "total(s)",
+        "mean(ms)",
+        "max(ms)",
+    )
+    if compare:
+        header += " %10s %8s" % ("before(s)", "change")
+    if compare and compare["project"] != report["project"]:
+        print(
+            "note: comparing against a different project: %s"
+            % ", ".join("%s=%s" % item for item in compare["project"].items())
+        )
+    print(header)
+    print("-" * len(header))
+
+    rows = list(report["hooks"].items())
+    rows.append(("(whole build)", {"total": report["total"]}))
+    for name, summary in rows:
+        if "calls" in summary:
+            line = "%-24s %8d %10.3f %10.3f %10.3f" % (
+                name,
+                summary["calls"],
+                summary["total"],
+                summary["mean"] * 1000,
+                summary["max"] * 1000,
+            )
+        else:
+            line = "%-24s %8s %10.3f %10s %10s" % (
+                name,
+                "",
+                summary["total"],
+                "",
+                "",
+            )
+        if compare:
+            if name == "(whole build)":
+                before = compare["total"]
+            else:
+                before = compare["hooks"].get(name, {}).get("total")
+            if before:
+                line += " %10.3f %+7.1f%%" % (
+                    before,
+                    (summary["total"] - before) / before * 100,
+                )
+        print(line)
+
+    line = "doctrees: %d bytes" % report["doctree_bytes"]
+    if compare and compare.get("doctree_bytes"):
+        line += " (before %d, %+.1f%%)" % (
+            compare["doctree_bytes"],
+            (report["doctree_bytes"] - compare["doctree_bytes"])
+            / compare["doctree_bytes"]
+            * 100,
+        )
+    print(line)
+
+    if report["warnings"]:
+        print("(%d warning lines emitted by the build)" % report["warnings"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--classes", type=int, default=40)
+    parser.add_argument(
+        "--code-blocks",
+        type=int,
+        default=2,
+        help="pairs of SQL code blocks per subsection",
+    )
+    parser.add_argument("--dialects", type=int, default=5)
+    parser.add_argument("--depth", type=int, default=3, help="toctree depth")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "-D",
+        dest="define",
+        action="append",
+        default=[],
+        metavar="name=value",
+        help="override a conf.py setting, as with sphinx-build",
+    )
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument(
+        "--compare", help="JSON report from an earlier run to compare to"
+    )
+    args = parser.parse_args(argv)
+
+    report = run(args)
+
+    compare = None
+    if args.compare:
+        with open(args.compare) as file_:
+            compare = json.load(file_)
+
+    print_report(report, compare)
+
+    if args.output:
+        with open(args.output, "w") as file_:
+            json.dump(report, file_, indent=2, sort_keys=True)
+
+    uncalled = uncalled_hooks(report)
+    if uncalled:
+        sys.exit(
+            "error: never called during the build, so not measured: %s"
+            % ", ".join(uncalled)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""Compare the speed of the pycon+sql lexer against the previous
+line-at-a-time RegexLexer version.
+
+python+sql still uses the line-at-a-time lexer, as lexing it in a single
+pass made no measurable difference.
+
+Run against real documentation, e.g. the SQLAlchemy ORM tutorial::
+
+    python tools/bench_sql_lexers.py ../sqlalchemy/doc/build/tutorial
+
+Without arguments, a synthetic tutorial-like corpus is used.
+
+"""
+
+import argparse
+import os
+import re
+import time
+
+from pygments.lexer import bygroups
+from pygments.lexer import RegexLexer
+from pygments.lexer import using
+from pygments.lexers import PythonConsoleLexer
+from pygments.token import Token
+
+from zzzeeksphinx.sqlformatter import PyConWithSQLLexer
+
+
+class PerLinePyConWithSQLLexer(RegexLexer):
+    name = "PyCon+SQL (per line)"
+
+    flags = re.IGNORECASE | re.DOTALL
+
+    tokens = {
+        "root": [
+            (r"{sql}", Token.Sql.Link, "sqlpopup"),
+            (r"{execsql}", Token.Sql.Exec, "execsql"),
+            (r"{opensql}", Token.Sql.Exec, "opensql"),  # alias of execsql
+            (r"{printsql}", Token.Sql.Print, "printsql"),
+            (r".*?\n", using(PythonConsoleLexer)),
+        ],
+        "sqlpopup": [
+            (
+                r"(.*?\n)((?:PRAGMA|BEGIN|WITH|SE\.\.\.|SELECT|INSERT|"
+                "DELETE|ROLLBACK|"
+                "COMMIT|ALTER|UPDATE|CREATE|DROP|PRAGMA"
+                "|DESCRIBE).*?(?:{stop}\n?|$))",
+                bygroups(using(PythonConsoleLexer), Token.Sql.Popup),
+                "#pop",
+            )
+        ],
+        "execsql": [(r".*?(?:{stop}\n*|$)", Token.Sql.ExecState, "#pop")],
+        "opensql": [(r".*?(?:{stop}\n*|$)", Token.Sql.ExecState, "#pop")],
+        "printsql": [(r".*?(?:{stop}\n*|$)", Token.Sql.PrintState, "#pop")],
+    }
+
+
+SAMPLE_PYCON = '''\
+>>> from sqlalchemy import select
+>>> stmt = select(User).where(User.name == "spongebob")
+>>> with Session(engine) as session:
+...     for row in session.execute(stmt):
+...         print(row)
+{execsql}BEGIN (implicit)
+SELECT user_account.id, user_account.name, user_account.fullname
+FROM user_account
+WHERE user_account.name = ?
+[...] ('spongebob',){stop}
+(User(id=1, name='spongebob', fullname='Spongebob Squarepants'),)
+{execsql}ROLLBACK{stop}
+>>> print(
+...     """a multi line
+... string"""
+... )
+a multi line
+string
+'''
+
+BLOCK_RE = re.compile(
+    r"^( *)\.\. sourcecode:: (pycon\+sql)\n"
+    r"(?:\1 +:.*\n)*\n"
+    r"((?:\1 +.*\n|\n)+)",
+    re.M,
+)
+
+
+def _extract_blocks(paths):
+    blocks = {"pycon+sql": []}
+    for path in paths:
+        if os.path.isdir(path):
+            fnames = [
+                os.path.join(dirpath, fname)
+                for dirpath, _, fnames in os.walk(path)
+                for fname in fnames
+                if fname.endswith(".rst")
+            ]
+        else:
+            fnames = [path]
+
+        for fname in fnames:
+            with open(fname) as file_:
+                content = file_.read()
+            for match in BLOCK_RE.finditer(content):
+                lines = match.group(3).rstrip("\n").split("\n")
+                indent = min(
+                    len(line) - len(line.lstrip())
+                    for line in lines
+                    if line.strip()
+                )
+                blocks[match.group(2)].append(
+                    "\n".join(line[indent:] for line in lines) + "\n"
+                )
+    return blocks
+
+
+def _time(lexer, blocks, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for block in blocks:
+            for _ in lexer.get_tokens(block):
+                pass
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "paths", nargs="*", help=".rst files or directories to scan"
+    )
+    parser.add_argument(
+        "--blocks",
+        type=int,
+        default=500,
+        help="number of synthetic blocks when no paths are given",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.paths:
+        blocks = _extract_blocks(args.paths)
+    else:
+        blocks = {"pycon+sql": [SAMPLE_PYCON] * args.blocks}
+
+    for alias, per_line, single_pass in [
+        ("pycon+sql", PerLinePyConWithSQLLexer(), PyConWithSQLLexer()),
+    ]:
+        if not blocks[alias]:
+            continue
+        size = sum(len(block) for block in blocks[alias])
+        before = _time(per_line, blocks[alias], args.repeat)
+        after = _time(single_pass, blocks[alias], args.repeat)
+        print(
+            "%-10s %5d blocks %8d chars  per line %.3fs  "
+            "single pass %.3fs  %.1fx"
+            % (
+                alias,
+                len(blocks[alias]),
+                size,
+                before,
+                after,
+                before / after,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
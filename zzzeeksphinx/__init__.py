@@ -4,6 +4,7 @@ __version__ = "1.6.2"
 def setup(app):
     from . import (
         autodoc_mods,
+        doctree_visitor,
         dialect_info,
         mako,
         sqlformatter,
@@ -11,6 +12,7 @@ def setup(app):
         scss,
         render_pydomains,
         extras,
+        profiling,
     )
 
     # we use jquery.  See
@@ -18,6 +20,7 @@ def setup(app):
     app.setup_extension("sphinxcontrib.jquery")
 
     autodoc_mods.setup(app)
+    doctree_visitor.setup(app)
     dialect_info.setup(app)
     mako.setup(app)
     sqlformatter.setup(app)
@@ -25,9 +28,12 @@ def setup(app):
     scss.setup(app)
     render_pydomains.setup(app)
     extras.setup(app)
+    profiling.setup(app)
 
     return {
         "version": __version__,
+        # bump when data kept in the pickled environment changes shape
+        "env_version": 3,
         "parallel_read_safe": True,
         "parallel_write_safe": True,
     }
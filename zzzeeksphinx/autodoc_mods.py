@@ -1,5 +1,9 @@
+import functools
+import importlib
 import inspect
 import re
+import sys
+import weakref
 
 from docutils import nodes
 from sphinx import addnodes
@@ -32,28 +36,192 @@ def autodoc_skip_member(app, what, name, obj, skip, options):
         return skip
 
 
-def _adjust_rendered_mod_name(config, modname, objname):
-    # new keys for autodocmods_convert_modname_w_class to suit sphinx 8
-    # conf comparison scheme
-    if f"{modname}.{objname}" in config.autodocmods_convert_modname_w_class:
-        return config.autodocmods_convert_modname_w_class[
-            f"{modname}.{objname}"
-        ]
-
-    # legacy; sphinx 8 has a conf comparison scheme that breaks with tuples
-    # as dict keys
-    elif (modname, objname) in config.autodocmods_convert_modname_w_class:
-        return config.autodocmods_convert_modname_w_class[(modname, objname)]
-    elif modname in config.autodocmods_convert_modname:
-        return config.autodocmods_convert_modname[modname]
-    else:
-        return modname
+class _ModuleRenamer:
+    """autodocmods_convert_modname and autodocmods_convert_modname_w_class
+    compiled into a single lookup.
+
+    A key of autodocmods_convert_modname ending in ``.*`` renames every
+    module within that package, e.g. ``{"sqlalchemy.sql.*":
+    "sqlalchemy"}``; an exact module name, then the longest matching
+    package, wins.
+
+    """
+
+    def __init__(self, convert_modname, convert_modname_w_class):
+        # (modname, objname) -> rendered module name
+        self.objects = {}
+        # legacy; sphinx 8 has a conf comparison scheme that breaks with
+        # tuples as dict keys, so "modname.objname" strings are preferred
+        for key, value in convert_modname_w_class.items():
+            if isinstance(key, tuple):
+                self.objects[key] = value
+        for key, value in convert_modname_w_class.items():
+            if not isinstance(key, tuple):
+                self.objects[tuple(key.rsplit(".", 1))] = value
+
+        self.modules = {}
+        self.packages = {}
+        for key, value in convert_modname.items():
+            if key.endswith(".*"):
+                self.packages[key[:-2]] = value
+            else:
+                self.modules[key] = value
+
+        self._memo = {}
+
+    def module(self, modname):
+        """Return the rendered name for a module, or None."""
+
+        try:
+            return self._memo[modname]
+        except KeyError:
+            pass
+
+        renamed = self.modules.get(modname)
+        if renamed is None and self.packages:
+            package = modname
+            while renamed is None and "." in package:
+                package = package.rsplit(".", 1)[0]
+                renamed = self.packages.get(package)
+        self._memo[modname] = renamed
+        return renamed
+
+    def rename(self, modname, objname):
+        key = (modname, objname)
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+
+        renamed = self.objects.get(key)
+        if renamed is None:
+            renamed = self.module(modname)
+            if renamed is None:
+                renamed = modname
+        self._memo[key] = renamed
+        return renamed
+
+
+def compile_module_renames(app, config):
+    app._zzzeeksphinx_module_renamer = _ModuleRenamer(
+        config.autodocmods_convert_modname,
+        config.autodocmods_convert_modname_w_class,
+    )
+
+
+def _adjust_rendered_mod_name(app, modname, objname):
+    return app._zzzeeksphinx_module_renamer.rename(modname, objname)
+
+
+# how many function objects _signature_summary() remembers
+SIGNATURE_CACHE_SIZE = 4096
+
+
+class _AutodocRecord:
+    """What autodoc-process-docstring collected from one document.
+
+    Only names and strings are kept, so that this pickles along with
+    the environment and merges back from parallel readers.
+
+    """
+
+    def __init__(self):
+        # function name -> summarized signature, for write_autosummaries()
+        self.signatures = {}
+        # superclass / inherited member names, for missing_reference()
+        self.inherited_names = set()
 
 
-# im sure this is in the app somewhere, but I don't really
-# know where, so we're doing it here.
-_track_autodoced = {}
-_inherited_names = set()
+def _autodoc_record(env):
+    if not hasattr(env, "_zzzeeksphinx_autodoc"):
+        env._zzzeeksphinx_autodoc = {}
+    record = env._zzzeeksphinx_autodoc.get(env.docname)
+    if record is None:
+        record = env._zzzeeksphinx_autodoc[env.docname] = _AutodocRecord()
+    return record
+
+
+def _add_inherited_name(env, adjusted_mod, modname, name):
+    # the name is linked under the adjusted module name, but may be
+    # referred to elsewhere by the module it really lives in
+    record = _autodoc_record(env)
+    record.inherited_names.add("%s.%s" % (adjusted_mod, name))
+    if modname != adjusted_mod:
+        record.inherited_names.add("%s.%s" % (modname, name))
+    _inherited_name_indexes.pop(env, None)
+
+
+class _InheritedNameIndex:
+    """All documents' inherited names, along with each of their
+    trailing ``Class.attr`` suffixes for ``.Class.attr`` style
+    references.
+
+    """
+
+    def __init__(self, records):
+        self.names = set()
+        for record in records:
+            self.names.update(record.inherited_names)
+
+        # no shorter than "Class.attr"; a lone attribute or method name
+        # would match references to any other object of that name
+        self.suffixes = set()
+        for name in self.names:
+            tokens = name.split(".")
+            for idx in range(1, len(tokens) - 1):
+                self.suffixes.add(".".join(tokens[idx:]))
+
+    def match(self, node):
+        target = node.attributes["reftarget"].lstrip("~")
+        specific = node.get("refspecific", False)
+        if target.startswith("."):
+            target = target[1:]
+            specific = True
+        return target in self.names or (specific and target in self.suffixes)
+
+
+# env -> _InheritedNameIndex; derived from the records, so kept out of
+# the environment rather than pickled and merged along with them
+_inherited_name_indexes = weakref.WeakKeyDictionary()
+
+
+def _inherited_name_index(env):
+    # rebuilt when a record changes
+    index = _inherited_name_indexes.get(env)
+    if index is None:
+        index = _inherited_name_indexes[env] = _InheritedNameIndex(
+            getattr(env, "_zzzeeksphinx_autodoc", {}).values()
+        )
+    return index
+
+
+def _note_class_dependency(env, cls):
+    # autodoc records the modules of the objects it documents; the
+    # inherited notes also depend on the modules of their superclasses,
+    # so that a change there re-reads this page in an incremental build
+    filename = getattr(sys.modules.get(cls.__module__), "__file__", None)
+    if filename:
+        env.note_dependency(filename)
+
+
+def purge_autodoc_records(app, env, docname):
+    if not hasattr(env, "_zzzeeksphinx_autodoc"):
+        return
+    env._zzzeeksphinx_autodoc.pop(docname, None)
+    _inherited_name_indexes.pop(env, None)
+
+
+def merge_autodoc_records(app, env, docnames, other):
+    if not hasattr(other, "_zzzeeksphinx_autodoc"):
+        return
+    if not hasattr(env, "_zzzeeksphinx_autodoc"):
+        env._zzzeeksphinx_autodoc = {}
+    for docname in docnames:
+        if docname in other._zzzeeksphinx_autodoc:
+            env._zzzeeksphinx_autodoc[docname] = other._zzzeeksphinx_autodoc[
+                docname
+            ]
+    _inherited_name_indexes.pop(env, None)
 
 
 def _superclass_classstring(
@@ -142,16 +310,159 @@ def _quick_inspect_sig(
     return result
 
 
+class _DescIndex:
+    """Locations of the desc nodes in a doctree that
+    write_autosummaries() works from, gathered in a single pass.
+
+    The doctree is either walked here, or, with no doctree given, fed
+    one node at a time through enter() and leave() by a visitor that
+    walks it for other reasons as well.
+
+    """
+
+    summary_objtypes = ("attribute", "data", "class", "function")
+    member_objtypes = ("classmethod", "method", "attribute")
+
+    def __init__(self, doctree=None):
+        # section -> desc children to summarize, in document order
+        self.sections = {}
+        # desc / desc_signature -> first desc_name within it
+        self.names = {}
+        # summarized class desc -> member descs within it, in document order
+        self.members = {}
+        # summarized class desc -> first desc_content within it
+        self.contents = {}
+
+        # descs / desc_signatures and summarized classes being walked
+        self._named = []
+        self._classes = []
+
+        if doctree is not None:
+            self._visit(doctree)
+
+    def _visit(self, node):
+        self.enter(node)
+        for child in node.children:
+            if isinstance(child, nodes.Element):
+                self._visit(child)
+        self.leave(node)
+
+    def enter(self, node):
+        if isinstance(node, nodes.section):
+            self.sections[node] = []
+        elif isinstance(node, addnodes.desc):
+            objtype = node.attributes.get("objtype", None)
+            if objtype in self.member_objtypes:
+                for class_node in self._classes:
+                    self.members[class_node].append(node)
+            parent = node.parent
+            if (
+                isinstance(parent, nodes.section)
+                and objtype in self.summary_objtypes
+            ):
+                self.sections[parent].append(node)
+                if objtype == "class":
+                    self.members[node] = []
+                    self._classes.append(node)
+            self._named.append(node)
+        elif isinstance(node, addnodes.desc_signature):
+            self._named.append(node)
+        elif isinstance(node, addnodes.desc_name):
+            for named_node in self._named:
+                self.names.setdefault(named_node, node)
+        elif isinstance(node, addnodes.desc_content):
+            for class_node in self._classes:
+                self.contents.setdefault(class_node, node)
+
+    def leave(self, node):
+        if isinstance(node, addnodes.desc):
+            if self._classes and self._classes[-1] is node:
+                self._classes.pop()
+            self._named.pop()
+        elif isinstance(node, addnodes.desc_signature):
+            self._named.pop()
+
+
+# inline nodes left out when docstring text is copied into a summary
+# table; they'd duplicate ids, footnotes, index entries etc.
+_SUMMARY_SKIP_NODES = (
+    nodes.target,
+    addnodes.index,
+    nodes.footnote_reference,
+    nodes.citation_reference,
+    nodes.substitution_reference,
+    nodes.image,
+    nodes.raw,
+)
+
+
+def _copy_summary_node(node):
+    copy = node.copy()
+    for key, value in copy.attributes.items():
+        if isinstance(value, list):
+            copy.attributes[key] = list(value)
+    copy["ids"] = []
+    copy["names"] = []
+    return copy
+
+
+def _copy_summary_children(node, copy, budget):
+    for child in node.children:
+        if budget is not None and budget[0] <= 0:
+            return
+        if isinstance(child, nodes.Text):
+            text = str(child)
+            if budget is not None:
+                if len(text) > budget[0]:
+                    words = text[: budget[0]].rsplit(None, 1)
+                    text = words[0] if len(words) > 1 else text[: budget[0]]
+                    text += "\u2026"
+                    budget[0] = 0
+                else:
+                    budget[0] -= len(text)
+            copy.append(nodes.Text(text))
+        elif isinstance(child, nodes.Inline) and not isinstance(
+            child, _SUMMARY_SKIP_NODES
+        ):
+            child_copy = _copy_summary_node(child)
+            _copy_summary_children(child, child_copy, budget)
+            copy.append(child_copy)
+
+
+def _summary_paragraph(para, max_length):
+    """Copy a docstring's first paragraph for a summary table.
+
+    Only text and inline markup such as references and literals are
+    copied, truncated to about ``max_length`` characters if given,
+    rather than a deepcopy() of the whole subtree.
+
+    """
+    copy = _copy_summary_node(para)
+    _copy_summary_children(para, copy, [max_length] if max_length else None)
+    return copy
+
+
+@functools.lru_cache(maxsize=SIGNATURE_CACHE_SIZE)
+def _signature_summary(fn):
+    # the same function is often documented under several names,
+    # e.g. when re-exported from a namespace module
+    try:
+        return _quick_inspect_sig(*inspect.getfullargspec(fn))
+    except (TypeError, AttributeError):
+        return "()"
+
+
 def write_autosummaries(app, doctree):
-    for node in doctree.traverse(nodes.section):
-
-        immediate_autodoc_nodes = [
-            n
-            for n in node.traverse(addnodes.desc)
-            if n.parent is node
-            and n.attributes.get("objtype", None)
-            in ("attribute", "data", "class", "function")
-        ]
+    write_autosummary_tables(app, _DescIndex(doctree))
+
+
+def write_autosummary_tables(app, index):
+    env = app.env
+    record = getattr(env, "_zzzeeksphinx_autodoc", {}).get(env.docname)
+    signatures = record.signatures if record is not None else {}
+    max_length = env.config.zzzeeksphinx_autosummary_max_length
+
+    for node, immediate_autodoc_nodes in index.sections.items():
         if not immediate_autodoc_nodes:
             continue
         where = node.index(immediate_autodoc_nodes[0])
@@ -196,17 +507,10 @@ def write_autosummaries(app, doctree):
 
             row = nodes.row("")
 
-            obj = _track_autodoced.get(refid, None)
-
-            if inspect.isfunction(obj):
-                param_str = _quick_inspect_sig(*inspect.getfullargspec(obj))
-            else:
-                param_str = ""
+            param_str = signatures.get(refid, "")
 
-            name_node = list(sig.traverse(addnodes.desc_name))
-            if name_node:
-                name_node = name_node[0]
-            else:
+            name_node = index.names.get(sig)
+            if name_node is None:
                 continue
 
             name_node = name_node.deepcopy()
@@ -243,7 +547,7 @@ def write_autosummaries(app, doctree):
                     para = ad_node[1][1]
 
                 if isinstance(para, nodes.paragraph):
-                    text = para.deepcopy()
+                    text = _summary_paragraph(para, max_length)
                 else:
                     text = nodes.Text("", "")
             except IndexError:
@@ -253,10 +557,8 @@ def write_autosummaries(app, doctree):
                 member_rows = []
 
                 attr_sig = None
-                for attr_desc in ad_node.traverse(addnodes.desc):
+                for attr_desc in index.members[ad_node]:
                     objtype = attr_desc.attributes.get("objtype")
-                    if objtype not in ("classmethod", "method", "attribute"):
-                        continue
 
                     attr_sig = attr_desc.children[0]
 
@@ -271,10 +573,7 @@ def write_autosummaries(app, doctree):
                     if not attr_ref_id or attr_ref_id.endswith(".__new__"):
                         continue
 
-                    attr_name_node = list(
-                        attr_desc.traverse(addnodes.desc_name)
-                    )[0]
-                    attr_name_node = attr_name_node.deepcopy()
+                    attr_name_node = index.names[attr_desc].deepcopy()
 
                     # Get the description (first paragraph of the member's
                     # docstring)
@@ -291,7 +590,9 @@ def write_autosummaries(app, doctree):
                             desc_para = attr_desc[1][1]
 
                         if isinstance(desc_para, nodes.paragraph):
-                            desc_text = desc_para.deepcopy()
+                            desc_text = _summary_paragraph(
+                                desc_para, max_length
+                            )
                         else:
                             desc_text = nodes.Text("")
                     except IndexError:
@@ -299,18 +600,7 @@ def write_autosummaries(app, doctree):
 
                     if objtype in ("classmethod", "method"):
                         # Get the function signature for methods
-                        attr_obj = _track_autodoced.get(attr_ref_id, None)
-                        if inspect.isfunction(attr_obj) or inspect.ismethod(
-                            attr_obj
-                        ):
-                            try:
-                                param_str = _quick_inspect_sig(
-                                    *inspect.getfullargspec(attr_obj)
-                                )
-                            except (TypeError, AttributeError):
-                                param_str = "()"
-                        else:
-                            param_str = "()"
+                        param_str = signatures.get(attr_ref_id, "()")
                     else:
                         param_str = ""
 
@@ -372,9 +662,8 @@ def write_autosummaries(app, doctree):
 
                     method_box = members_table
 
-                    content = ad_node.traverse(addnodes.desc_content)
-                    if content:
-                        content = list(content)[0]
+                    content = index.contents.get(ad_node)
+                    if content is not None:
                         for i, n in enumerate(content.children):
                             if isinstance(n, (addnodes.index, addnodes.desc)):
                                 content.insert(i, method_box)
@@ -392,50 +681,40 @@ def write_autosummaries(app, doctree):
 
 def fix_up_autodoc_headers(app, doctree):
 
-    for idx, node in enumerate(doctree.traverse(addnodes.desc)):
-        objtype = node.attributes.get("objtype")
-        if objtype in ("method", "attribute"):
-            sig = node.children[0]
+    for node in doctree.traverse(addnodes.desc):
+        fix_up_autodoc_header(node)
 
-            modname = sig.attributes["module"]
-            clsname = sig.attributes["class"]
-            qualified = "%s.%s." % (modname, clsname)
 
-            start_index = 0
-            is_classmethod = False
-            if sig[0].rawsource == "async ":
-                start_index = 1
-            elif "classmethod" in sig[0].rawsource:
-                is_classmethod = True
-                start_index = 1
+def fix_up_autodoc_header(node):
+    objtype = node.attributes.get("objtype")
+    if objtype in ("method", "attribute"):
+        sig = node.children[0]
 
-            sig.insert(
-                start_index,
-                nodes.reference(
-                    "",
-                    "",
-                    nodes.literal(qualified, qualified),
-                    refid="%s.%s" % (modname, clsname),
-                ),
-            )
-
-            # sphinx seems to put the qualifier "classmethod" for classmethods,
-            # so don't add our "method" qualifier in that case
-            if not is_classmethod:
-                sig.insert(
-                    start_index,
-                    addnodes.desc_annotation(
-                        objtype, nodes.Text(objtype + " ", objtype + " ")
-                    ),
-                )
+        modname = sig.attributes["module"]
+        clsname = sig.attributes["class"]
+        qualified = "%s.%s." % (modname, clsname)
 
-        elif objtype == "function":
-            sig = node.children[0]
+        start_index = 0
+        is_classmethod = False
+        if sig[0].rawsource == "async ":
+            start_index = 1
+        elif "classmethod" in sig[0].rawsource:
+            is_classmethod = True
+            start_index = 1
 
-            start_index = 0
-            if sig[0].rawsource == "async ":
-                start_index = 1
+        sig.insert(
+            start_index,
+            nodes.reference(
+                "",
+                "",
+                nodes.literal(qualified, qualified),
+                refid="%s.%s" % (modname, clsname),
+            ),
+        )
 
+        # sphinx seems to put the qualifier "classmethod" for classmethods,
+        # so don't add our "method" qualifier in that case
+        if not is_classmethod:
             sig.insert(
                 start_index,
                 addnodes.desc_annotation(
@@ -443,6 +722,20 @@ def fix_up_autodoc_headers(app, doctree):
                 ),
             )
 
+    elif objtype == "function":
+        sig = node.children[0]
+
+        start_index = 0
+        if sig[0].rawsource == "async ":
+            start_index = 1
+
+        sig.insert(
+            start_index,
+            addnodes.desc_annotation(
+                objtype, nodes.Text(objtype + " ", objtype + " ")
+            ),
+        )
+
 
 def autodoc_process_signature(
     app, what, name, obj, options, signature, return_annotation
@@ -453,15 +746,37 @@ def autodoc_process_signature(
         m = re.match(r"^(.*?)\.([\w_]+)$", return_annotation)
         if m:
             modname, objname = m.group(1, 2)
-            config = app.env.config
-            if modname in config.autodocmods_convert_modname:
-                modname = config.autodocmods_convert_modname[modname]
+            renamed = app._zzzeeksphinx_module_renamer.module(modname)
+            if renamed is not None:
+                modname = renamed
 
                 new_return_annotation = "%s.%s" % (modname, objname)
                 return_annotation = new_return_annotation
         return (signature, return_annotation)
 
 
+def _resolve_class(clsname):
+    """Return the class named by a dotted path, or None.
+
+    Looked up from its module each time rather than remembered from
+    wherever the class itself was autodoced, so that a member documented
+    on its own, on any page, still finds its class.
+
+    """
+    tokens = clsname.split(".")
+    for idx in range(len(tokens) - 1, 0, -1):
+        try:
+            obj = importlib.import_module(".".join(tokens[:idx]))
+        except ImportError:
+            continue
+        for attrname in tokens[idx:]:
+            obj = getattr(obj, attrname, None)
+            if obj is None:
+                return None
+        return obj if inspect.isclass(obj) else None
+    return None
+
+
 def autodoc_process_docstring(app, what, name, obj, options, lines):
     # skipping superclass classlevel docs for now, as these
     # get in the way of using autosummary.
@@ -471,9 +786,9 @@ def autodoc_process_docstring(app, what, name, obj, options, lines):
     # comes out of autodoc, so I dont really see the point of
     # _adjust_rendered_mod_name() too much.
 
-    if what in ("class", "exception"):
-        _track_autodoced[name] = obj
+    env = app.env
 
+    if what in ("class", "exception"):
         # need to translate module names for bases, others
         # as we document lots of symbols in namespace modules
         # outside of their source
@@ -491,10 +806,13 @@ def autodoc_process_docstring(app, what, name, obj, options, lines):
         for base in obj_bases:
             if base is not object:
                 adjusted_mod = _adjust_rendered_mod_name(
-                    app.env.config, base.__module__, base.__name__
+                    app, base.__module__, base.__name__
                 )
                 bases.append(_superclass_classstring(adjusted_mod, base))
-                _inherited_names.add("%s.%s" % (adjusted_mod, base.__name__))
+                _note_class_dependency(env, base)
+                _add_inherited_name(
+                    env, adjusted_mod, base.__module__, base.__name__
+                )
 
         if bases:
 
@@ -509,24 +827,30 @@ def autodoc_process_docstring(app, what, name, obj, options, lines):
         m = re.match(r"(.*?)\.([\w_]+)$", name)
         if m:
             clsname, attrname = m.group(1, 2)
-            if clsname in _track_autodoced:
-                cls = _track_autodoced[clsname]
+            cls = _resolve_class(clsname)
+            if cls is not None:
                 found = False
                 for supercls in cls.__mro__:
                     if attrname in supercls.__dict__:
                         found = True
                         break
                 if found and supercls is not cls and supercls is not object:
+                    _note_class_dependency(env, supercls)
                     adjusted_mod = _adjust_rendered_mod_name(
-                        app.env.config, supercls.__module__, supercls.__name__
+                        app, supercls.__module__, supercls.__name__
                     )
 
-                    _inherited_names.add(
-                        "%s.%s" % (adjusted_mod, supercls.__name__)
+                    _add_inherited_name(
+                        env,
+                        adjusted_mod,
+                        supercls.__module__,
+                        supercls.__name__,
                     )
-                    _inherited_names.add(
-                        "%s.%s.%s"
-                        % (adjusted_mod, supercls.__name__, attrname)
+                    _add_inherited_name(
+                        env,
+                        adjusted_mod,
+                        supercls.__module__,
+                        "%s.%s" % (supercls.__name__, attrname),
                     )
                     lines[:0] = [
                         ".. container:: inherited_member",
@@ -551,16 +875,35 @@ def autodoc_process_docstring(app, what, name, obj, options, lines):
                         "",
                     ]
     elif what == "function":
-        _track_autodoced[name] = obj
+        if inspect.isfunction(obj):
+            _autodoc_record(env).signatures[name] = _signature_summary(obj)
 
 
 def missing_reference(app, env, node, contnode):
-    if node.attributes["reftarget"] in _inherited_names:
+    counts = app._builder_missing_references
+    if _inherited_name_index(env).match(node):
+        counts["resolved"] += 1
         return node.children[0]
     else:
+        counts["passed"] += 1
         return None
 
 
+def reset_missing_reference_counts(app):
+    app._builder_missing_references = {"resolved": 0, "passed": 0}
+
+
+def report_missing_reference_counts(app, exception):
+    counts = app._builder_missing_references
+    if counts["resolved"] or counts["passed"]:
+        LOG.info(
+            "unresolved references: %d short-circuited as inherited names, "
+            "%d passed on",
+            counts["resolved"],
+            counts["passed"],
+        )
+
+
 def work_around_issue_6785():
     """See https://github.com/sphinx-doc/sphinx/issues/6785"""
 
@@ -605,9 +948,13 @@ def setup(app):
     app.connect("autodoc-skip-member", autodoc_skip_member)
     app.connect("autodoc-process-docstring", autodoc_process_docstring)
     app.connect("autodoc-process-signature", autodoc_process_signature)
-    app.connect("doctree-read", fix_up_autodoc_headers)
-    app.connect("doctree-read", write_autosummaries)
     app.add_config_value("autodocmods_convert_modname", {}, "env")
     app.add_config_value("autodocmods_convert_modname_w_class", {}, "env")
+    app.add_config_value("zzzeeksphinx_autosummary_max_length", 0, "env")
+    app.connect("config-inited", compile_module_renames)
 
     app.connect("missing-reference", missing_reference)
+    app.connect("builder-inited", reset_missing_reference_counts)
+    app.connect("build-finished", report_missing_reference_counts)
+    app.connect("env-purge-doc", purge_autodoc_records)
+    app.connect("env-merge-info", merge_autodoc_records)
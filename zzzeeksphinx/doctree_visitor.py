@@ -0,0 +1,119 @@
+from docutils import nodes
+
+from . import autodoc_mods
+from . import extras
+from . import render_pydomains
+
+
+class DoctreeReadVisitor(nodes.SparseNodeVisitor):
+    """Walks a doctree once at doctree-read, doing the work of
+    fix_up_autodoc_headers(), write_autosummaries(), replace_synonyms()
+    and move_footer() as their nodes come by.
+
+    Anything that changes the shape of the tree, i.e. the autosummary
+    tables and the footers, is collected and applied once the walk is
+    done.
+
+    """
+
+    def __init__(self, document, synonyms, synonym_counts):
+        super().__init__(document)
+        self.synonyms = synonyms
+        self.synonym_counts = synonym_counts
+        self.desc_index = autodoc_mods._DescIndex()
+        self.footers = []
+        # node class -> (visit method, depart method), either may be None
+        self._dispatch = {}
+
+    def unknown_visit(self, node):
+        pass
+
+    def unknown_departure(self, node):
+        pass
+
+    def _handler(self, name):
+        # SparseNodeVisitor's own no-op methods aren't worth calling
+        if getattr(nodes.SparseNodeVisitor, name, None) is getattr(
+            type(self), name, None
+        ):
+            return None
+        return getattr(self, name)
+
+    def walk(self, node):
+        """Same as ``node.walkabout(self)``, without its per-node debug
+        messages, and skipping the Text nodes that make up much of a
+        doctree and that nothing here looks at.
+
+        """
+        cls = node.__class__
+        try:
+            visit, depart = self._dispatch[cls]
+        except KeyError:
+            visit, depart = self._dispatch[cls] = (
+                self._handler("visit_" + cls.__name__),
+                self._handler("depart_" + cls.__name__),
+            )
+
+        if visit is not None:
+            visit(node)
+        for child in node.children[:]:
+            if isinstance(child, nodes.Element):
+                self.walk(child)
+        if depart is not None:
+            depart(node)
+
+    def visit_pending_xref(self, node):
+        self.synonyms.replace(node, self.synonym_counts)
+
+    def visit_footer_topic(self, node):
+        self.footers.append(node)
+
+    def visit_section(self, node):
+        self.desc_index.enter(node)
+
+    def visit_desc(self, node):
+        # the signature is changed before the walk gets to it, as
+        # fix_up_autodoc_headers() would have done beforehand
+        autodoc_mods.fix_up_autodoc_header(node)
+        self.desc_index.enter(node)
+
+    def depart_desc(self, node):
+        self.desc_index.leave(node)
+
+    def visit_desc_signature(self, node):
+        self.desc_index.enter(node)
+
+    def depart_desc_signature(self, node):
+        self.desc_index.leave(node)
+
+    def visit_desc_name(self, node):
+        self.desc_index.enter(node)
+
+    def visit_desc_content(self, node):
+        self.desc_index.enter(node)
+
+
+def process_doctree(app, doctree):
+    if not app.config.zzzeeksphinx_single_pass_doctree_read:
+        autodoc_mods.fix_up_autodoc_headers(app, doctree)
+        autodoc_mods.write_autosummaries(app, doctree)
+        render_pydomains.replace_synonyms(app, doctree)
+        extras.move_footer(app, doctree)
+        return
+
+    visitor = DoctreeReadVisitor(
+        doctree,
+        app._zzzeeksphinx_synonym_replacer,
+        render_pydomains.synonym_counts(app.env),
+    )
+    visitor.walk(doctree)
+
+    # the summary tables copy references that have had their synonyms
+    # replaced already
+    autodoc_mods.write_autosummary_tables(app, visitor.desc_index)
+    extras.move_footers(doctree, visitor.footers)
+
+
+def setup(app):
+    app.add_config_value("zzzeeksphinx_single_pass_doctree_read", True, "")
+    app.connect("doctree-read", process_doctree)
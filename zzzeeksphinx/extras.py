@@ -65,11 +65,15 @@ footer_topic_visit = (visit_footer_topic, depart_footer_topic)
 
 
 def move_footer(app, doctree):
+    move_footers(doctree, doctree.traverse(footer_topic))
 
-    if doctree.traverse(footer_topic):
+
+def move_footers(doctree, footers):
+
+    if footers:
         dec = nodes.decoration()
         doctree.append(dec)
-        for f1 in doctree.traverse(footer_topic):
+        for f1 in footers:
             dec.append(f1.deepcopy())
             f1.parent.remove(f1)
 
@@ -100,5 +104,3 @@ def setup(app):
     app.add_node(
         footer_topic, **{key: footer_topic_visit for key in ["html", "html5"]}
     )
-
-    app.connect("doctree-read", move_footer)
@@ -7,10 +7,14 @@ from mako.lookup import TemplateLookup
 from sphinx.application import TemplateBridge
 from sphinx.jinja2glue import BuiltinTemplateLoader
 
+from . import toc
 from .toc import TOCMixin
 
 rtd = os.environ.get("READTHEDOCS", None) == "True"
 
+# subdirectory of the doctree dir where compiled templates are kept
+MAKO_CACHE_DIR = "zzzeeksphinx_mako"
+
 
 class MakoBridge(TOCMixin, TemplateBridge):
     def init(self, builder, *args, **kw):
@@ -33,6 +37,19 @@ class MakoBridge(TOCMixin, TemplateBridge):
             package_dir, "themes", builder.config.html_theme
         )
 
+        # compiled template modules persist alongside the doctrees; mako
+        # recompiles a module whenever its template file is newer.  The
+        # theme name is part of the path as the same template names are
+        # present in more than one theme.
+        if builder.config["zzzeeksphinx_mako_cache"]:
+            module_directory = os.path.join(
+                builder.doctreedir,
+                MAKO_CACHE_DIR,
+                builder.config.html_theme,
+            )
+        else:
+            module_directory = None
+
         # note: don't use strict_undefined.   it means that a variable
         # cannot even be used conditionally, or with any inheriting template
         # that attempts to override the %def/%block that would normally
@@ -50,6 +67,7 @@ class MakoBridge(TOCMixin, TemplateBridge):
             ),
             # format_exceptions=True,
             imports=["from zzzeeksphinx import util"],
+            module_directory=module_directory,
         )
 
         if rtd and builder.config["site_base"]:
@@ -77,6 +95,42 @@ class MakoBridge(TOCMixin, TemplateBridge):
     def setup_ctx(self, context):
         pass
 
+    def warm_up(self):
+        """Compile all of the theme's templates up front.
+
+        Writers forked for a parallel build then inherit the compiled
+        templates rather than each compiling them on their own.
+
+        """
+        for directory in self.lookup.directories:
+            if not os.path.isdir(directory):
+                continue
+            for fname in sorted(os.listdir(directory)):
+                if fname.endswith(".mako"):
+                    self.lookup.get_template(fname)
+
+    def _newest_template(self):
+        return max(
+            (
+                (os.stat(os.path.join(root, fname)).st_mtime, fname)
+                for directory in self.lookup.directories
+                for root, dirs, files in os.walk(directory)
+                for fname in files
+                if fname.endswith(".mako")
+            ),
+            default=(0, ""),
+        )
+
+    def newest_template_mtime(self):
+        """The mtime of the newest of the theme's templates, so that
+        pages written before a template was changed are out of date.
+
+        """
+        return self._newest_template()[0]
+
+    def newest_template_name(self):
+        return self._newest_template()[1]
+
     def render(self, template, context):
         template = template.replace(".html", ".mako")
         context["prevtopic"] = context.pop("prev", None)
@@ -109,6 +163,18 @@ class MakoBridge(TOCMixin, TemplateBridge):
         return self.jinja2_fallback.render_string(template, context)
 
 
+def warm_up_templates(app):
+    templates = getattr(app.builder, "templates", None)
+    if isinstance(templates, MakoBridge):
+        templates.warm_up()
+
+
+def reset_navigation_tree(app, env):
+    templates = getattr(app.builder, "templates", None)
+    if isinstance(templates, TOCMixin):
+        templates.reset_navigation_tree()
+
+
 def setup(app):
     app.config["template_bridge"] = "zzzeeksphinx.mako.MakoBridge"
     app.add_config_value("release_date", "", "env")
@@ -116,3 +182,11 @@ def setup(app):
     app.add_config_value("site_adapter_template", "", "env")
     app.add_config_value("site_adapter_py", "", "env")
     app.add_config_value("build_number", "", "env")
+    app.add_config_value("zzzeeksphinx_local_toc_cache", True, "html")
+    app.add_config_value("zzzeeksphinx_mako_cache", True, "html")
+    app.connect("builder-inited", warm_up_templates)
+    app.connect("env-updated", reset_navigation_tree)
+    app.connect("doctree-read", toc.record_top_anchor)
+    app.connect("env-purge-doc", toc.purge_top_anchor)
+    app.connect("env-purge-doc", toc.purge_local_toc)
+    app.connect("env-merge-info", toc.merge_top_anchors)
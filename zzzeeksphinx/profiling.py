@@ -0,0 +1,300 @@
+import functools
+import inspect
+import json
+import os
+import time
+
+from sphinx.util import logging
+from sphinx.util.build_phase import BuildPhase
+
+from .util import ForkedProcessResults
+
+LOG = logging.getLogger(__name__)
+
+# subdirectory of the doctree dir where forked processes leave their timings
+PROFILE_DIR = "zzzeeksphinx_profile"
+
+# default report filename, in the doctree dir
+PROFILE_FILE = "zzzeeksphinx_profile.json"
+
+# how many of the slowest documents to list in the summary table
+PROFILE_TOP_DOCNAMES = 15
+
+# events where a positional argument (after app) is the docname
+_DOCNAME_ARGS = {
+    "doctree-resolved": 1,
+    "env-purge-doc": 1,
+    "html-page-context": 0,
+}
+
+
+class ProfileData:
+    """Call counts and wall time for each wrapped handler and each
+    document, collected in one process.
+
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        # (event, handler name) -> [calls, total, max]
+        self.handlers = {}
+        # docname -> [calls, total]
+        self.docnames = {}
+
+    def record(self, event, name, docname, elapsed):
+        stats = self.handlers.get((event, name))
+        if stats is None:
+            self.handlers[(event, name)] = [1, elapsed, elapsed]
+        else:
+            stats[0] += 1
+            stats[1] += elapsed
+            if elapsed > stats[2]:
+                stats[2] = elapsed
+
+        if docname:
+            stats = self.docnames.get(docname)
+            if stats is None:
+                self.docnames[docname] = [1, elapsed]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed
+
+    def merge(self, other):
+        for key, (calls, total, max_) in other.handlers.items():
+            stats = self.handlers.get(key)
+            if stats is None:
+                self.handlers[key] = [calls, total, max_]
+            else:
+                stats[0] += calls
+                stats[1] += total
+                stats[2] = max(stats[2], max_)
+        for docname, (calls, total) in other.docnames.items():
+            stats = self.docnames.get(docname)
+            if stats is None:
+                self.docnames[docname] = [calls, total]
+            else:
+                stats[0] += calls
+                stats[1] += total
+
+
+# timings for this process; kept out of the environment so that they're
+# neither pickled with it nor sent back with it from parallel readers
+_profile = None
+
+_forked_profiles = ForkedProcessResults(PROFILE_DIR)
+
+
+def _forked_profile():
+    return _profile
+
+
+def _profile_data():
+    global _profile
+
+    # a reader or writer forked for a parallel build inherits the
+    # parent's data; start over so that only its own calls are
+    # collected, which it leaves on disk as it exits
+    if _profile is None or _profile.pid != os.getpid():
+        _profile = ProfileData()
+        _forked_profiles.write_on_exit(_forked_profile)
+    return _profile
+
+
+def _handler_name(handler):
+    module = handler.__module__
+    if module.startswith("zzzeeksphinx."):
+        module = module[len("zzzeeksphinx.") :]
+    return "%s.%s" % (module, handler.__qualname__)
+
+
+def _docname(app, event, args):
+    if event in _DOCNAME_ARGS:
+        return args[_DOCNAME_ARGS[event]]
+    elif event == "missing-reference":
+        return args[1].get("refdoc")
+    elif app.phase is BuildPhase.READING:
+        return app.env.docname
+    else:
+        return None
+
+
+def _wrap_handler(event, handler):
+    name = _handler_name(handler)
+
+    if inspect.isgeneratorfunction(handler):
+        # e.g. html-collect-pages; the work happens as the pages are
+        # iterated, so time each step, leaving out whatever the caller
+        # does with each page in between
+        @functools.wraps(handler)
+        def profiled(app, *args):
+            elapsed = 0.0
+            iterator = handler(app, *args)
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    yield item
+            finally:
+                _profile_data().record(
+                    event, name, _docname(app, event, args), elapsed
+                )
+
+    else:
+
+        @functools.wraps(handler)
+        def profiled(app, *args):
+            start = time.perf_counter()
+            try:
+                return handler(app, *args)
+            finally:
+                elapsed = time.perf_counter() - start
+                _profile_data().record(
+                    event, name, _docname(app, event, args), elapsed
+                )
+
+    profiled._zzzeeksphinx_profiled = True
+    return profiled
+
+
+def _wrap_render(app, render):
+    @functools.wraps(render)
+    def profiled(template, context):
+        start = time.perf_counter()
+        try:
+            return render(template, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            _profile_data().record(
+                "template",
+                "mako.MakoBridge.render",
+                context.get("pagename"),
+                elapsed,
+            )
+
+    return profiled
+
+
+def install_profiling(app, config):
+    """Wrap every event handler registered by zzzeeksphinx.
+
+    This runs once all extensions have been set up, so that the
+    handlers connected by each zzzeeksphinx module are in place.
+
+    """
+    global _profile
+
+    if not config.zzzeeksphinx_profile:
+        return
+
+    # start over here rather than at builder-inited, so that the
+    # builder-inited handlers are included
+    _profile = ProfileData()
+    _forked_profiles.reset(app)
+
+    for event, listeners in app.events.listeners.items():
+        for idx, listener in enumerate(listeners):
+            handler = listener.handler
+            if (
+                not getattr(handler, "__module__", "").startswith(
+                    "zzzeeksphinx."
+                )
+                or handler.__module__ == __name__
+                or getattr(handler, "_zzzeeksphinx_profiled", False)
+            ):
+                continue
+            listeners[idx] = listener._replace(
+                handler=_wrap_handler(event, handler)
+            )
+
+
+def wrap_template_render(app):
+    if not app.config.zzzeeksphinx_profile:
+        return
+
+    templates = getattr(app.builder, "templates", None)
+    if templates is not None and hasattr(templates, "render"):
+        templates.render = _wrap_render(app, templates.render)
+
+
+def _format_table(data):
+    lines = [
+        "%-26s %-40s %7s %9s %9s %9s"
+        % ("event", "handler", "calls", "total(s)", "mean(ms)", "max(ms)")
+    ]
+    for (event, name), (calls, total, max_) in sorted(
+        data.handlers.items(), key=lambda item: item[1][1], reverse=True
+    ):
+        lines.append(
+            "%-26s %-40s %7d %9.3f %9.3f %9.3f"
+            % (event, name, calls, total, total / calls * 1000, max_ * 1000)
+        )
+
+    if data.docnames:
+        lines.append("")
+        lines.append(
+            "%-67s %7s %9s" % ("slowest documents", "calls", "total(s)")
+        )
+        for docname, (calls, total) in sorted(
+            data.docnames.items(), key=lambda item: item[1][1], reverse=True
+        )[:PROFILE_TOP_DOCNAMES]:
+            lines.append("%-67s %7d %9.3f" % (docname, calls, total))
+    return lines
+
+
+def report_profile(app, exception):
+    if not app.config.zzzeeksphinx_profile or exception is not None:
+        return
+
+    data = ProfileData()
+    data.merge(_profile_data())
+    for forked in _forked_profiles.collect():
+        data.merge(forked)
+
+    for line in _format_table(data):
+        LOG.info(line)
+
+    fname = app.config.zzzeeksphinx_profile_file or os.path.join(
+        app.doctreedir, PROFILE_FILE
+    )
+    report = {
+        "handlers": [
+            {
+                "event": event,
+                "handler": name,
+                "calls": calls,
+                "total": total,
+                "mean": total / calls,
+                "max": max_,
+            }
+            for (event, name), (calls, total, max_) in sorted(
+                data.handlers.items(),
+                key=lambda item: item[1][1],
+                reverse=True,
+            )
+        ],
+        "docnames": {
+            docname: {"calls": calls, "total": total}
+            for docname, (calls, total) in sorted(data.docnames.items())
+        },
+    }
+    with open(fname, "w") as file_:
+        json.dump(report, file_, indent=2)
+    LOG.info("zzzeeksphinx profile written to %s", fname)
+
+
+def setup(app):
+    app.add_config_value(
+        "zzzeeksphinx_profile",
+        bool(os.environ.get("ZZZEEKSPHINX_PROFILE")),
+        "",
+    )
+    app.add_config_value("zzzeeksphinx_profile_file", None, "")
+    app.connect("config-inited", install_profiling)
+    app.connect("builder-inited", wrap_template_render)
+    # after the other build-finished handlers, so that they're included
+    app.connect("build-finished", report_profile, priority=900)
@@ -1,35 +1,51 @@
+import os
 import re
+import weakref
 
 from docutils import nodes
 from sphinx.addnodes import pending_xref
 from sphinx.util import logging
 
+from .util import ForkedProcessResults
+
 LOG = logging.getLogger(__name__)
 
+# subdirectory of the doctree dir where forked readers leave their counts
+SYNONYM_COUNTS_DIR = "zzzeeksphinx_synonym_counts"
 
-def replace_synonyms(app, doctree):
 
-    py_nodes = doctree.traverse(pending_xref)
+# shortened to the last name, as they're referred to within a module
+_SHORT_RAWSOURCE = re.compile(r"^:(?:func|obj|data|mod):`[\.~].+`$")
+_SHORT_CLASS_RAWSOURCE = re.compile(r"^:class:`\..+`$")
 
-    replace_prefixes = app.env.config.zzzeeksphinx_module_prefixes
+# reftypes whose display name doesn't depend on how they were written
+_MEMBER_REFTYPES = frozenset(["meth", "attr", "paramref"])
 
-    for py_node in py_nodes:
-        if not py_node.children or not py_node.children[0].children:
-            continue
+SYNONYM_OUTCOMES = ("corrected", "skipped", "unhandled")
 
-        reftype = py_node.attributes["reftype"]
-        reftarget = py_node.attributes["reftarget"]
 
-        needs_correction = False
+class _SynonymReplacer:
+    """zzzeeksphinx_module_prefixes, along with what has been worked out
+    for each distinct reference so far.
 
-        ref_tokens = reftarget.split(".")
-        if ref_tokens[0] in replace_prefixes:
-            ref_tokens[0] = replace_prefixes[ref_tokens[0]]
+    """
+
+    def __init__(self, replace_prefixes):
+        self.replace_prefixes = replace_prefixes
+        # (reftype, reftarget, rawsource or None) ->
+        # (new reftarget or None, display name or None, outcome)
+        self._memo = {}
 
-            needs_correction = True
-            py_node.attributes["reftarget"] = ".".join(ref_tokens)
+    def classify(self, reftype, reftarget, rawsource):
+        new_reftarget = None
 
-        if reftype in ("meth", "attr", "paramref"):
+        ref_tokens = reftarget.split(".")
+        needs_correction = ref_tokens[0] in self.replace_prefixes
+        if needs_correction:
+            ref_tokens[0] = self.replace_prefixes[ref_tokens[0]]
+            new_reftarget = ".".join(ref_tokens)
+
+        if reftype in _MEMBER_REFTYPES:
             lt = len(ref_tokens)
             if (
                 reftype == "paramref"
@@ -44,39 +60,115 @@ def replace_synonyms(app, doctree):
                 need = min(lt, 2)
             corrected_name = ".".join(ref_tokens[-need:])
         elif reftype in ("func", "obj", "data", "mod"):
-            if needs_correction or re.match(
-                r"^:(?:func|obj|data|mod):`[\.~].+`$", py_node.rawsource
-            ):
+            if needs_correction or _SHORT_RAWSOURCE.match(rawsource):
                 corrected_name = ref_tokens[-1]
             else:
-                # print(
-                #    "no longer correcting: %s %s %s"
-                #    % (py_node.rawsource, py_node.source, py_node.line)
-                # )
-                continue
+                return new_reftarget, None, "skipped"
         elif reftype == "class" and (
-            needs_correction or re.match(r"^:class:`\..+`$", py_node.rawsource)
+            needs_correction or _SHORT_CLASS_RAWSOURCE.match(rawsource)
         ):
             corrected_name = ref_tokens[-1]
+        elif needs_correction:
+            return new_reftarget, None, "unhandled"
         else:
-            if needs_correction:
-                LOG.warn(
-                    "source %r at %s needs synonym correction but is not "
-                    "handled by zzzeeksphinx",
-                    py_node.rawsource,
-                    py_node.source,
-                )
-            continue
+            return new_reftarget, None, "skipped"
 
         if reftype in ("meth", "func"):
             corrected_name += "()"
+        return new_reftarget, corrected_name, "corrected"
+
+    def replace(self, py_node, counts):
+        if not py_node.children or not py_node.children[0].children:
+            counts["skipped"] += 1
+            return
+
+        attributes = py_node.attributes
+        reftype = attributes["reftype"]
+        reftarget = attributes["reftarget"]
+        key = (
+            reftype,
+            reftarget,
+            None if reftype in _MEMBER_REFTYPES else py_node.rawsource,
+        )
+        try:
+            new_reftarget, corrected_name, outcome = self._memo[key]
+        except KeyError:
+            new_reftarget, corrected_name, outcome = self._memo[key] = (
+                self.classify(reftype, reftarget, py_node.rawsource)
+            )
+        counts[outcome] += 1
+
+        if new_reftarget is not None:
+            attributes["reftarget"] = new_reftarget
+
+        if corrected_name is not None:
+            py_node.children[0].pop(0)
+            py_node.children[0].insert(0, nodes.Text(corrected_name))
+        elif outcome == "unhandled":
+            LOG.warn(
+                "source %r at %s needs synonym correction but is not "
+                "handled by zzzeeksphinx",
+                py_node.rawsource,
+                py_node.source,
+            )
+
+
+def compile_synonyms(app, config):
+    app._zzzeeksphinx_synonym_replacer = _SynonymReplacer(
+        config.zzzeeksphinx_module_prefixes
+    )
+
+
+# env -> (pid, outcome counts); diagnostics only, so kept out of the
+# environment rather than pickled along with it
+_synonym_counts = weakref.WeakKeyDictionary()
+
+_forked_synonym_counts = ForkedProcessResults(SYNONYM_COUNTS_DIR)
+
+
+def synonym_counts(env):
+    # a reader forked for a parallel build starts with a copy of the
+    # parent's counts; start over, and leave its own on disk as it exits
+    pid = os.getpid()
+    entry = _synonym_counts.get(env)
+    if entry is None or entry[0] != pid:
+        counts = dict.fromkeys(SYNONYM_OUTCOMES, 0)
+        entry = _synonym_counts[env] = (pid, counts)
+        _forked_synonym_counts.write_on_exit(lambda: counts)
+    return entry[1]
+
+
+def replace_synonyms(app, doctree):
+    replacer = app._zzzeeksphinx_synonym_replacer
+    counts = synonym_counts(app.env)
+
+    for py_node in doctree.traverse(pending_xref):
+        replacer.replace(py_node, counts)
+
+
+def reset_synonym_counts(app):
+    _synonym_counts.pop(app.env, None)
+    _forked_synonym_counts.reset(app)
+
+
+def report_synonym_counts(app, exception):
+    counts = dict(synonym_counts(app.env))
+    for forked in _forked_synonym_counts.collect():
+        for outcome, count in forked.items():
+            counts[outcome] += count
 
-        py_node.children[0].pop(0)
-        py_node.children[0].insert(
-            0, nodes.Text(corrected_name, corrected_name)
+    if any(counts.values()):
+        LOG.info(
+            "python references: %d display names shortened, %d left as "
+            "is, %d needing correction but not handled",
+            counts["corrected"],
+            counts["skipped"],
+            counts["unhandled"],
         )
 
 
 def setup(app):
-    app.connect("doctree-read", replace_synonyms)
     app.add_config_value("zzzeeksphinx_module_prefixes", {}, "env")
+    app.connect("config-inited", compile_synonyms)
+    app.connect("builder-inited", reset_synonym_counts)
+    app.connect("build-finished", report_synonym_counts)
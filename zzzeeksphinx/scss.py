@@ -1,6 +1,10 @@
 from __future__ import absolute_import
 
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
 import os
+import re
+import shutil
 
 import sass
 
@@ -8,6 +12,12 @@ import sass
 # these docs aren't super accurate
 # http://pyscss.readthedocs.org/en/latest/
 
+# subdirectory of the doctree dir where compiled stylesheets are kept
+SCSS_CACHE_DIR = "zzzeeksphinx_scss"
+
+# hex digits of the content hash used in fingerprinted asset filenames
+FINGERPRINT_LENGTH = 12
+
 
 def _check_for_builder(app):
     # TODO: make this inclusive of HTML builders
@@ -18,23 +28,104 @@ def _check_for_builder(app):
         return True
 
 
+def _scss_digest(source, output_style):
+    # the libsass version is part of the key as its output can vary
+    return hashlib.sha1(
+        ("%s\n%s\n%s" % (sass.libsass_version, output_style, source)).encode(
+            "utf-8"
+        )
+    ).hexdigest()
+
+
+def _fingerprinted(fname, digest):
+    name, ext = os.path.splitext(fname)
+    return "%s.%s%s" % (name, digest[:FINGERPRINT_LENGTH], ext)
+
+
+def _output_style(app):
+    if app.config.zzzeeksphinx_asset_pipeline:
+        return "compressed"
+    else:
+        return "nested"
+
+
+def _static_path(config):
+    package_dir = os.path.abspath(os.path.dirname(__file__))
+    return os.path.join(package_dir, "themes", config.html_theme, "static")
+
+
+def fingerprint_assets(app, config):
+    """Work out the fingerprinted names of static assets.
+
+    The mapping goes into html_context, so that it is part of the config
+    hash Sphinx keeps in .buildinfo; pages written against an older
+    version of an asset are then out of date.
+
+    """
+    if not config.zzzeeksphinx_asset_pipeline:
+        return
+
+    static_path = _static_path(config)
+    if not os.path.isdir(static_path):
+        return
+
+    output_style = _output_style(app)
+    assets = {}
+    for fname in os.listdir(static_path):
+        name, ext = os.path.splitext(fname)
+        if ext == ".scss":
+            with open(os.path.join(static_path, fname)) as file_:
+                digest = _scss_digest(file_.read(), output_style)
+            assets["_static/%s.css" % name] = "_static/%s" % _fingerprinted(
+                "%s.css" % name, digest
+            )
+        elif ext in (".css", ".js"):
+            with open(os.path.join(static_path, fname), "rb") as file_:
+                digest = hashlib.sha1(file_.read()).hexdigest()
+            assets["_static/%s" % fname] = "_static/%s" % _fingerprinted(
+                fname, digest
+            )
+
+    config.html_context = dict(
+        config.html_context, zzzeeksphinx_static_assets=assets
+    )
+
+
+def _assets(app):
+    return app.config.html_context.get("zzzeeksphinx_static_assets", {})
+
+
 def add_stylesheet(app):
     if not _check_for_builder(app):
         return
 
     to_gen = []
+    to_copy = []
 
-    package_dir = os.path.abspath(os.path.dirname(__file__))
-    static_path = os.path.join(
-        package_dir, "themes", app.builder.config.html_theme, "static"
-    )
+    assets = _assets(app)
+    static_path = _static_path(app.builder.config)
 
     for fname in os.listdir(static_path):
         name, ext = os.path.splitext(fname)
         if ext == ".scss":
-            to_gen.append((static_path, name))
-        elif ext == ".css":
-            if hasattr(app, "add_css_file"):
+            css_name = os.path.basename(
+                assets.get("_static/%s.css" % name, "%s.css" % name)
+            )
+            to_gen.append((static_path, name, css_name))
+        elif ext in (".css", ".js"):
+            if "_static/%s" % fname in assets:
+                # static files are copied as usual; the fingerprinted
+                # copy is written alongside them at build-finished
+                to_copy.append(
+                    (
+                        os.path.join(static_path, fname),
+                        os.path.basename(assets["_static/%s" % fname]),
+                    )
+                )
+
+            if ext == ".js":
+                continue
+            elif hasattr(app, "add_css_file"):
                 app.add_css_file(fname)
             else:
                 app.add_stylesheet(fname)
@@ -43,13 +134,26 @@ def add_stylesheet(app):
     # down into build-finished (env.temp_data gets emptied).
     # So make our own!
     app._builder_scss = to_gen
+    app._builder_static_copies = to_copy
 
-    for path, name in to_gen:
+    for path, name, css_name in to_gen:
         # changed in 1.8
         # https://www.sphinx-doc.org/en/master/extdev/appapi.html#sphinx.application.Sphinx.add_css_file
         app.add_css_file("%s.css" % name)
 
 
+def add_asset_context(app, pagename, templatename, context, doctree):
+    """Provide templates with the fingerprinted name of static assets,
+    including for the theme's own stylesheet that sphinx adds."""
+
+    assets = _assets(app)
+    context["static_asset"] = lambda path: assets.get(path, path)
+
+
+def _compile_scss(source, output_style):
+    return sass.compile(string=source, output_style=output_style)
+
+
 def generate_stylesheet(app, exception):
     # TODO: make this inclusive of HTML builders
     # instead, or something
@@ -60,19 +164,62 @@ def generate_stylesheet(app, exception):
 
     if exception:
         return
-    for static_path, name in to_gen:
 
-        css = sass.compile(
-            string=open(os.path.join(static_path, "%s.scss" % name)).read()
+    static_dir = os.path.join(app.builder.outdir, "_static")
+    for source_file, fname in app._builder_static_copies:
+        shutil.copyfile(source_file, os.path.join(static_dir, fname))
+
+    cache_dir = os.path.join(app.doctreedir, SCSS_CACHE_DIR)
+    use_cache = app.config.zzzeeksphinx_scss_cache
+    output_style = _output_style(app)
+
+    to_compile = []
+    for static_path, name, css_name in to_gen:
+        with open(os.path.join(static_path, "%s.scss" % name)) as file_:
+            source = file_.read()
+
+        dest = os.path.join(static_dir, css_name)
+        cached = os.path.join(
+            cache_dir,
+            "%s-%s.css" % (name, _scss_digest(source, output_style)),
         )
 
-        dest = os.path.join(app.builder.outdir, "_static", "%s.css" % name)
-        # copyfile(os.path.join(source, "%s.css" % name), dest)
+        # stylesheet unchanged since it was last compiled
+        if use_cache and os.path.exists(cached):
+            shutil.copyfile(cached, dest)
+        else:
+            to_compile.append((name, source, dest, cached))
+
+    sources = [source for _, source, _, _ in to_compile]
+    if app.parallel > 1 and len(to_compile) > 1:
+        with ProcessPoolExecutor(
+            max_workers=min(app.parallel, len(to_compile))
+        ) as executor:
+            compiled = list(
+                executor.map(
+                    _compile_scss, sources, [output_style] * len(sources)
+                )
+            )
+    else:
+        compiled = [_compile_scss(source, output_style) for source in sources]
 
+    for (name, source, dest, cached), css in zip(to_compile, compiled):
         with open(dest, "w") as out:
             out.write(css)
 
+        if use_cache:
+            os.makedirs(cache_dir, exist_ok=True)
+            # only the most recent compilation of a stylesheet is kept
+            for fname in os.listdir(cache_dir):
+                if re.match(r"%s-[0-9a-f]+\.css$" % re.escape(name), fname):
+                    os.remove(os.path.join(cache_dir, fname))
+            shutil.copyfile(dest, cached)
+
 
 def setup(app):
+    app.connect("config-inited", fingerprint_assets)
     app.connect("builder-inited", add_stylesheet)
     app.connect("build-finished", generate_stylesheet)
+    app.connect("html-page-context", add_asset_context)
+    app.add_config_value("zzzeeksphinx_scss_cache", True, "html")
+    app.add_config_value("zzzeeksphinx_asset_pipeline", False, "html")
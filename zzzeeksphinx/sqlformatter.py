@@ -1,6 +1,13 @@
 from __future__ import absolute_import
 
+import functools
+import hashlib
+import json
+import logging as std_logging
+import os
 import re
+import sqlite3
+import time
 
 import pygments
 from pygments.filter import apply_filters
@@ -8,16 +15,42 @@ from pygments.filter import Filter
 from pygments.formatters import HtmlFormatter
 from pygments.formatters import LatexFormatter
 from pygments.lexer import bygroups
+from pygments.lexer import Lexer
 from pygments.lexer import RegexLexer
 from pygments.lexer import using
 from pygments.lexer import words
 from pygments.lexers import PythonConsoleLexer
 from pygments.lexers import PythonLexer
 from pygments.lexers import SqlLexer
+from pygments.token import Error
 from pygments.token import Keyword
 from pygments.token import Token
+from pygments.token import Whitespace
 from sphinx import highlighting
 from sphinx.highlighting import PygmentsBridge
+from sphinx.util import logging
+
+from . import __version__
+from .util import ForkedProcessResults
+
+LOG = logging.getLogger(__name__)
+
+# where PygmentsBridge.highlight_block() logs its warnings
+_HIGHLIGHTING_LOG = logging.getLogger(highlighting.__name__)
+
+# file in the doctree dir holding the persistent highlight cache
+HIGHLIGHT_CACHE_FILE = "zzzeeksphinx_highlight.sqlite"
+
+# code block languages whose highlighted output is persisted
+CACHED_HIGHLIGHT_LANGUAGES = ("python+sql", "pycon+sql")
+
+# subdirectory of the doctree dir where forked writers leave the keys
+# of the highlight cache entries they used
+HIGHLIGHT_CACHE_USED_DIR = "zzzeeksphinx_highlight_used"
+
+# subdirectory of the doctree dir where forked writers leave their
+# SQL highlight cache counts
+SQL_HIGHLIGHT_COUNTS_DIR = "zzzeeksphinx_sql_highlight"
 
 
 def _strip_trailing_whitespace(iter_):
@@ -103,35 +136,116 @@ class DetectAnnotationsFilter(Filter):
             yield Token.Other, f"pep484 annotations detected: {annotated}"
 
 
-class PyConWithSQLLexer(RegexLexer):
-    name = "PyCon+SQL"
-    aliases = ["pycon+sql"]
+class _PythonWithSQLMarkersLexer(Lexer):
+    """Base for console lexers that accept embedded ``{sql}`` style markers.
 
-    flags = re.IGNORECASE | re.DOTALL
+    The text is split on the markers up front, and each contiguous run of
+    Python between them goes to a single invocation of the Python lexer,
+    rather than one per line, so that constructs spanning lines such as
+    triple quoted strings and console continuation lines are lexed
+    correctly.  Tokens are otherwise produced as the original
+    ``RegexLexer`` rules did, including their error recovery.
 
-    tokens = {
-        "root": [
-            (r"{sql}", Token.Sql.Link, "sqlpopup"),
-            (r"{execsql}", Token.Sql.Exec, "execsql"),
-            (r"{opensql}", Token.Sql.Exec, "opensql"),  # alias of execsql
-            (r"{printsql}", Token.Sql.Print, "printsql"),
-            (r".*?\n", using(PythonConsoleLexer)),
-        ],
-        "sqlpopup": [
-            (
-                r"(.*?\n)((?:PRAGMA|BEGIN|WITH|SE\.\.\.|SELECT|INSERT|"
-                "DELETE|ROLLBACK|"
-                "COMMIT|ALTER|UPDATE|CREATE|DROP|PRAGMA"
-                "|DESCRIBE).*?(?:{stop}\n?|$))",
-                bygroups(using(PythonConsoleLexer), Token.Sql.Popup),
-                "#pop",
-            )
-        ],
-        "execsql": [(r".*?(?:{stop}\n*|$)", Token.Sql.ExecState, "#pop")],
-        "opensql": [(r".*?(?:{stop}\n*|$)", Token.Sql.ExecState, "#pop")],
-        "printsql": [(r".*?(?:{stop}\n*|$)", Token.Sql.PrintState, "#pop")],
+    """
+
+    python_lexer_cls = None
+    sqlpopup_re = None
+
+    marker_re = re.compile(r"{(sql|execsql|opensql|printsql)}", re.I)
+
+    # newline ending the last Python line ahead of a marker
+    python_end_re = re.compile(
+        r"\n(?={(?:sql|execsql|opensql|printsql)})", re.I
+    )
+
+    sql_state_re = re.compile(r".*?(?:{stop}\n*|$)", re.I | re.DOTALL)
+
+    marker_tokens = {
+        "sql": (Token.Sql.Link, None),
+        "execsql": (Token.Sql.Exec, Token.Sql.ExecState),
+        # alias of execsql
+        "opensql": (Token.Sql.Exec, Token.Sql.ExecState),
+        "printsql": (Token.Sql.Print, Token.Sql.PrintState),
     }
 
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.python_lexer = self.python_lexer_cls(**options)
+
+    def _python_tokens(self, offset, text):
+        for index, ttype, value in self.python_lexer.get_tokens_unprocessed(
+            text
+        ):
+            yield offset + index, ttype, value
+
+    def get_tokens_unprocessed(self, text):
+        pos = 0
+        end = len(text)
+        while pos < end:
+            marker = self.marker_re.match(text, pos)
+            if marker is None:
+                python_end = self.python_end_re.search(text, pos)
+                if python_end is not None:
+                    region_end = python_end.end()
+                else:
+                    region_end = text.rfind("\n") + 1
+
+                if region_end <= pos:
+                    # no complete line left
+                    for index in range(pos, end):
+                        yield index, Error, text[index]
+                    return
+
+                yield from self._python_tokens(pos, text[pos:region_end])
+                pos = region_end
+                continue
+
+            marker_token, state_token = self.marker_tokens[
+                marker.group(1).lower()
+            ]
+            yield pos, marker_token, marker.group()
+            pos = marker.end()
+
+            state_re = (
+                self.sqlpopup_re if state_token is None else self.sql_state_re
+            )
+            while pos < end:
+                match = state_re.match(text, pos)
+                if match is None:
+                    # not what's expected after the marker; flag this line
+                    # as an error and resume lexing Python on the next one
+                    if text[pos] == "\n":
+                        yield pos, Whitespace, "\n"
+                        pos += 1
+                        break
+                    yield pos, Error, text[pos]
+                    pos += 1
+                elif state_token is None:
+                    yield from self._python_tokens(
+                        match.start(1), match.group(1)
+                    )
+                    yield match.start(2), Token.Sql.Popup, match.group(2)
+                    pos = match.end()
+                    break
+                else:
+                    yield pos, state_token, match.group()
+                    pos = match.end()
+                    break
+
+
+class PyConWithSQLLexer(_PythonWithSQLMarkersLexer):
+    name = "PyCon+SQL"
+    aliases = ["pycon+sql"]
+
+    python_lexer_cls = PythonConsoleLexer
+    sqlpopup_re = re.compile(
+        r"(.*?\n)((?:PRAGMA|BEGIN|WITH|SE\.\.\.|SELECT|INSERT|"
+        "DELETE|ROLLBACK|"
+        "COMMIT|ALTER|UPDATE|CREATE|DROP|PRAGMA"
+        "|DESCRIBE).*?(?:{stop}\n?|$))",
+        re.I | re.DOTALL,
+    )
+
 
 class PythonWithSQLLexer(RegexLexer):
     name = "Python+SQL"
@@ -162,11 +276,37 @@ class PythonWithSQLLexer(RegexLexer):
     }
 
 
+# the same handful of SQL statements show up over and over again in
+# tutorial-style docs, so these are shared across all code blocks
+_sql_lexer = RealWorldSQLLexer()
+_sql_formatter = HtmlFormatter(nowrap=True)
+
+
+def _uncached_highlight_sql(sql):
+    return pygments.highlight(sql, _sql_lexer, _sql_formatter)
+
+
+# replaced at config-inited with the configured size
+_highlight_sql = functools.lru_cache(maxsize=1024)(_uncached_highlight_sql)
+
+# _highlight_sql.cache_info() as it was when this process was forked, so
+# that a forked writer counts only its own hits and misses
+_inherited_cache_info = None
+
+_forked_counts = ForkedProcessResults(SQL_HIGHLIGHT_COUNTS_DIR)
+
+
+def _note_fork():
+    global _inherited_cache_info
+    _inherited_cache_info = _highlight_sql.cache_info()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_note_fork)
+
+
 class PopupSQLFormatter(HtmlFormatter):
     def _format_lines(self, tokensource):
-        sql_lexer = RealWorldSQLLexer()
-
-        formatter = HtmlFormatter(nowrap=True)
         buf = []
         for ttype, value in apply_filters(tokensource, [StripDocTestFilter()]):
             if ttype in Token.Sql:
@@ -184,10 +324,8 @@ class PopupSQLFormatter(HtmlFormatter):
                     yield (
                         1,
                         f"<div class='{class_}'>%s</div>"
-                        % pygments.highlight(
-                            re.sub(r"(?:{stop}|\n+)\s*$", "", value),
-                            sql_lexer,
-                            formatter,
+                        % _highlight_sql(
+                            re.sub(r"(?:{stop}|\n+)\s*$", "", value)
                         ),
                     )
                 elif ttype is Token.Sql.Link:
@@ -196,10 +334,8 @@ class PopupSQLFormatter(HtmlFormatter):
                     yield (
                         1,
                         "<div class='popup_sql'>%s</div>"
-                        % pygments.highlight(
-                            re.sub(r"(?:{stop}|\n+)$", "", value),
-                            sql_lexer,
-                            formatter,
+                        % _highlight_sql(
+                            re.sub(r"(?:{stop}|\n+)$", "", value)
                         ),
                     )
             else:
@@ -297,6 +433,12 @@ class AnnoPopupSQLFormatter(
 
 
 def setup_formatters(app, config):
+    global _highlight_sql
+
+    _highlight_sql = functools.lru_cache(
+        maxsize=config.zzzeeksphinx_sql_highlight_cache_size
+    )(_uncached_highlight_sql)
+
     if config.zzzeeksphinx_annotation_key:
         PygmentsBridge.html_formatter = AnnoPopupSQLFormatter
         filters = [DetectAnnotationsFilter()]
@@ -318,6 +460,272 @@ def setup_formatters(app, config):
     PygmentsBridge.latex_formatter = PopupLatexFormatter
 
 
+def _sql_highlight_counts():
+    info = _highlight_sql.cache_info()
+    hits, misses = info.hits, info.misses
+    if _inherited_cache_info is not None:
+        hits -= _inherited_cache_info.hits
+        misses -= _inherited_cache_info.misses
+    return hits, misses, info.currsize
+
+
+def _forked_sql_highlight_counts():
+    hits, misses, currsize = _sql_highlight_counts()
+    if hits or misses:
+        return hits, misses, currsize
+    return None
+
+
+def reset_sql_highlight_counts(app):
+    _forked_counts.reset(app)
+
+
+def note_sql_highlight_writer(app, pagename, templatename, context, doctree):
+    # a forked writer leaves its counts for report_sql_highlight_cache()
+    _forked_counts.write_on_exit(_forked_sql_highlight_counts)
+
+
+def report_sql_highlight_cache(app, exception):
+    hits, misses, currsize = _sql_highlight_counts()
+    processes = 1
+
+    for counts in _forked_counts.collect():
+        hits += counts[0]
+        misses += counts[1]
+        currsize = max(currsize, counts[2])
+        processes += 1
+
+    if not hits and not misses:
+        return
+    if processes > 1:
+        # each writer process has a cache of its own
+        LOG.info(
+            "SQL highlight cache: %d hits, %d misses across %d processes, "
+            "at most %d of %d entries used",
+            hits,
+            misses,
+            processes,
+            currsize,
+            _highlight_sql.cache_info().maxsize,
+        )
+    else:
+        LOG.info(
+            "SQL highlight cache: %d hits, %d misses, %d of %d entries used",
+            hits,
+            misses,
+            currsize,
+            _highlight_sql.cache_info().maxsize,
+        )
+
+
+class _CollectWarnings(std_logging.Handler):
+    def __init__(self):
+        super().__init__(std_logging.WARNING)
+        self.warnings = []
+
+    def emit(self, record):
+        self.warnings.append(
+            (
+                record.getMessage(),
+                getattr(record, "type", None),
+                getattr(record, "subtype", None),
+            )
+        )
+
+
+class HighlightCache:
+    """Persistent cache of highlighted code blocks, stored in sqlite.
+
+    Entries are keyed on everything that determines the HTML produced:
+    the source and highlighting options of the block, the lexer, the
+    formatter in use and the versions of pygments and zzzeeksphinx.
+    Once there are more than ``max_entries``, the least recently used
+    entries are dropped at the end of the build.
+
+    Warnings emitted while a block was highlighted are stored with it
+    and emitted again when the entry is used.
+
+    """
+
+    # bumped when the table changes shape; an older table is dropped
+    schema_version = 2
+
+    def __init__(self, filename, max_entries, key_prefix):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.key_prefix = key_prefix
+        self._connection = None
+        self._pid = None
+        # keys of the entries used by this process, whose last_used is
+        # brought up to date at the end of the build rather than on
+        # each use; forked writers leave theirs on disk
+        self.used = set()
+        self._forked_used = ForkedProcessResults(HIGHLIGHT_CACHE_USED_DIR)
+
+    @property
+    def connection(self):
+        # a connection can't be shared with the processes forked for a
+        # parallel write, so each process opens its own
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(
+                self.filename, timeout=60, isolation_level=None
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            (version,) = self._connection.execute(
+                "PRAGMA user_version"
+            ).fetchone()
+            if version != self.schema_version:
+                self._connection.execute("DROP TABLE IF EXISTS highlight")
+                self._connection.execute(
+                    "PRAGMA user_version = %d" % self.schema_version
+                )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS highlight "
+                "(key TEXT PRIMARY KEY, html TEXT NOT NULL, "
+                "warnings TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._pid = os.getpid()
+        return self._connection
+
+    def reset(self, app):
+        self._forked_used.reset(app)
+
+    def key(self, source, lang, opts, force, kwargs):
+        return hashlib.sha1(
+            repr(
+                (
+                    self.key_prefix,
+                    lang,
+                    sorted((opts or {}).items()),
+                    force,
+                    sorted(kwargs.items()),
+                    source,
+                )
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def _used_keys(self):
+        return sorted(self.used) or None
+
+    def get(self, key):
+        row = self.connection.execute(
+            "SELECT html, warnings FROM highlight WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self.used.add(key)
+        self._forked_used.write_on_exit(self._used_keys)
+        return row[0], json.loads(row[1])
+
+    def put(self, key, html, warnings):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO highlight "
+            "(key, html, warnings, last_used) VALUES (?, ?, ?, ?)",
+            (key, html, json.dumps(warnings), time.time()),
+        )
+
+    def touch(self):
+        """Bring last_used up to date for the entries used in this
+        build, by this process and by any forked writers.
+
+        """
+        used = set(self.used)
+        for keys in self._forked_used.collect():
+            used.update(keys)
+        if used:
+            now = time.time()
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.executemany(
+                    "UPDATE highlight SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in sorted(used)],
+                )
+        self.used.clear()
+
+    def evict(self):
+        (count,) = self.connection.execute(
+            "SELECT COUNT(*) FROM highlight"
+        ).fetchone()
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM highlight WHERE key IN "
+                "(SELECT key FROM highlight ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def wrap(self, highlighter):
+        """Route a PygmentsBridge's highlight_block() through the cache."""
+
+        highlight_block = highlighter.highlight_block
+
+        def cached_highlight_block(
+            source, lang, opts=None, force=False, location=None, **kwargs
+        ):
+            if lang not in CACHED_HIGHLIGHT_LANGUAGES:
+                return highlight_block(
+                    source, lang, opts, force, location, **kwargs
+                )
+
+            key = self.key(source, lang, opts, force, kwargs)
+            cached = self.get(key)
+            if cached is not None:
+                html, warnings = cached
+                for message, type_, subtype in warnings:
+                    _HIGHLIGHTING_LOG.warning(
+                        "%s",
+                        message,
+                        type=type_,
+                        subtype=subtype,
+                        location=location,
+                    )
+                return html
+
+            # e.g. the lexing error that has pygments retry in relaxed
+            # mode, which only shows up when the block is highlighted
+            collect = _CollectWarnings()
+            _HIGHLIGHTING_LOG.logger.addHandler(collect)
+            try:
+                html = highlight_block(
+                    source, lang, opts, force, location, **kwargs
+                )
+            finally:
+                _HIGHLIGHTING_LOG.logger.removeHandler(collect)
+            self.put(key, html, collect.warnings)
+            return html
+
+        highlighter.highlight_block = cached_highlight_block
+
+
+def setup_highlight_cache(app):
+    if not app.config.zzzeeksphinx_highlight_cache:
+        return
+
+    highlighter = getattr(app.builder, "highlighter", None)
+    if highlighter is None or highlighter.dest != "html":
+        return
+
+    os.makedirs(app.doctreedir, exist_ok=True)
+    app._zzzeeksphinx_highlight_cache = cache = HighlightCache(
+        os.path.join(app.doctreedir, HIGHLIGHT_CACHE_FILE),
+        app.config.zzzeeksphinx_highlight_cache_max_entries,
+        (
+            PygmentsBridge.html_formatter.__name__,
+            app.config.zzzeeksphinx_annotation_key,
+            pygments.__version__,
+            __version__,
+        ),
+    )
+    cache.reset(app)
+    cache.wrap(highlighter)
+
+
+def evict_highlight_cache(app, exception):
+    cache = getattr(app, "_zzzeeksphinx_highlight_cache", None)
+    if cache is not None and not exception:
+        cache.touch()
+        cache.evict()
+
+
 def setup(app):
 
     # pass lexer class instead of lexer instance
@@ -325,5 +733,15 @@ def setup(app):
     app.add_lexer("python+sql", PythonWithSQLLexer)
 
     app.add_config_value("zzzeeksphinx_annotation_key", None, "env")
+    app.add_config_value("zzzeeksphinx_sql_highlight_cache_size", 1024, "html")
+    app.add_config_value("zzzeeksphinx_highlight_cache", False, "html")
+    app.add_config_value(
+        "zzzeeksphinx_highlight_cache_max_entries", 20000, "html"
+    )
 
     app.connect("config-inited", setup_formatters)
+    app.connect("builder-inited", reset_sql_highlight_counts)
+    app.connect("html-page-context", note_sql_highlight_writer)
+    app.connect("build-finished", report_sql_highlight_cache)
+    app.connect("builder-inited", setup_highlight_cache)
+    app.connect("build-finished", evict_highlight_cache)
@@ -336,10 +336,10 @@ withsidebar = bool(toc) and (
 
     <!-- begin iterate through sphinx environment script_files -->
     % for scriptfile in [script.filename for script in script_files] + self.attr.local_script_files:
-        <script type="text/javascript" src="${pathto(scriptfile, 1)}"></script>
+        <script type="text/javascript" src="${pathto(static_asset(scriptfile), 1)}"></script>
     % endfor
     <!-- end iterate through sphinx environment script_files -->
 
-    <script type="text/javascript" src="${pathto('_static/init.js', 1)}"></script>
+    <script type="text/javascript" src="${pathto(static_asset('_static/init.js'), 1)}"></script>
 
 </%block>
@@ -1,4 +1,7 @@
 #!coding: utf-8
+import hashlib
+import os
+import pickle
 import re
 from typing import cast
 
@@ -6,15 +9,198 @@ from docutils import nodes as docutils_nodes
 from sphinx.application import Sphinx
 from sphinx.builders.html import StandaloneHTMLBuilder
 from sphinx.environment.adapters.toctree import TocTree
+from sphinx.util import url_re
+
+from . import __version__
+from .util import SPHINX_VERSION
 
 
 UNDERSCORE_RE = re.compile(r"_\w+\.(.+)$")
 
+# subdirectory of the doctree dir where rendered local tocs are kept
+LOCAL_TOC_CACHE_DIR = "zzzeeksphinx_local_toc"
+
+
+def _top_anchor(doctree):
+    """Return the first id of the first section in a doctree, if any."""
+
+    for section in doctree.findall(docutils_nodes.section):
+        if section.attributes["ids"]:
+            return section.attributes["ids"][0]
+        break
+    return None
+
+
+def record_top_anchor(app, doctree):
+    env = app.env
+    if not hasattr(env, "_zzzeeksphinx_top_anchors"):
+        env._zzzeeksphinx_top_anchors = {}
+    env._zzzeeksphinx_top_anchors[env.docname] = _top_anchor(doctree)
+
+
+def purge_top_anchor(app, env, docname):
+    if hasattr(env, "_zzzeeksphinx_top_anchors"):
+        env._zzzeeksphinx_top_anchors.pop(docname, None)
+
+
+def merge_top_anchors(app, env, docnames, other):
+    if not hasattr(other, "_zzzeeksphinx_top_anchors"):
+        return
+    if not hasattr(env, "_zzzeeksphinx_top_anchors"):
+        env._zzzeeksphinx_top_anchors = {}
+    env._zzzeeksphinx_top_anchors.update(
+        (docname, other._zzzeeksphinx_top_anchors[docname])
+        for docname in docnames
+        if docname in other._zzzeeksphinx_top_anchors
+    )
+
+
+def _local_toc_cache_path(doctreedir, docname):
+    return os.path.join(doctreedir, LOCAL_TOC_CACHE_DIR, docname + ".pickle")
+
+
+def purge_local_toc(app, env, docname):
+    # the document is gone or about to be read again; a cached toc that's
+    # still wanted is written again along with the page
+    try:
+        os.remove(_local_toc_cache_path(app.doctreedir, docname))
+    except OSError:
+        pass
+
+
+def _reference_text(elem):
+    """Split a toctree reference into its title nodes and the remainder."""
+
+    for index, sub_elem in enumerate(elem.children, 1):
+        if isinstance(
+            sub_elem,
+            (docutils_nodes.Text, docutils_nodes.literal),
+        ):
+            continue
+        else:
+            break
+
+    local_text = elem.children[0:index]
+    return str(local_text[0]), local_text, elem.children[index:]
+
+
+class _DocnameURIBuilder:
+    """Stand-in builder used to resolve the global toctree once per build.
+
+    Sphinx rewrites toctree refuris relative to the page being written;
+    this leaves them as plain docnames so that they can be made relative
+    to each page later on.
+
+    """
+
+    def __init__(self, builder):
+        self.tags = builder.tags
+
+    def get_relative_uri(self, from_, to, typ=None):
+        return to
+
+
+class _NavigationTree:
+    """The full global toctree, flattened into a list of entries.
+
+    Each entry is a tuple of
+    ``(level, internal, docname, anchorname, reference)``, where ``level``
+    is the nesting depth of the reference node within the tree, as
+    :meth:`.TOCMixin._locate_nodes` counts it.  For non-internal links,
+    ``docname`` is the external URL.
+
+    :meth:`.visible_entries` then derives the entries of the collapsed
+    toctree Sphinx would produce for a given page, walking only the
+    entries that are actually displayed.
+
+    """
+
+    def __init__(self, raw_tree, toctree_includes):
+        self.entries = []
+        self.children = {None: []}
+        self.parents = []
+        self.by_docname = {}
+
+        # same precedence as sphinx's own toctree ancestor lookup
+        self.doc_parents = {}
+        for parent, children in toctree_includes.items():
+            self.doc_parents.update(dict.fromkeys(children, parent))
+
+        list_items = {}
+        for reference in raw_tree.findall(docutils_nodes.reference):
+            level = 0
+            node = reference
+            list_item = parent_item = None
+            while node is not raw_tree:
+                if isinstance(node, docutils_nodes.list_item):
+                    if list_item is None:
+                        list_item = node
+                    elif parent_item is None:
+                        parent_item = node
+                node = node.parent
+                level += 1
+
+            refuri = reference["refuri"]
+            anchorname = reference.get("anchorname", "")
+            internal = url_re.match(refuri) is None
+            if internal and anchorname:
+                docname = refuri[: -len(anchorname)]
+            else:
+                docname = refuri
+
+            index = len(self.entries)
+            parent = list_items.get(id(parent_item))
+            if list_item is not None:
+                list_items.setdefault(id(list_item), index)
+
+            self.entries.append(
+                (level, internal, docname, anchorname, reference)
+            )
+            self.parents.append(parent)
+            self.children[parent].append(index)
+            self.children[index] = []
+            if internal:
+                self.by_docname.setdefault(docname, []).append(index)
+
+    def _ancestors(self, docname):
+        ancestors = set()
+        while docname in self.doc_parents and docname not in ancestors:
+            ancestors.add(docname)
+            docname = self.doc_parents[docname]
+        return ancestors
+
+    def visible_entries(self, docname):
+        ancestors = self._ancestors(docname)
+        entries = self.entries
+        parents = self.parents
+
+        # the entries whose sub-bullets sphinx keeps when collapsing;
+        # the contents of documents that aren't ancestors of this one are
+        # already gone before "current" entries are determined
+        expanded = set()
+        for index in self.by_docname.get(docname, ()):
+            chain = [index]
+            parent = parents[index]
+            while parent is not None and entries[parent][2] in ancestors:
+                chain.append(parent)
+                parent = parents[parent]
+            if parent is None:
+                expanded.update(i for i in chain if entries[i][2] in ancestors)
+
+        stack = list(reversed(self.children[None]))
+        while stack:
+            index = stack.pop()
+            yield entries[index]
+            if index in expanded:
+                stack.extend(reversed(self.children[index]))
+
 
 class TOCMixin:
 
     app: Sphinx
 
+    _navigation_tree = None
+
     def get_current_subtoc(self, current_page_name, start_from=None):
         """Return a TOC for sub-files and sub-elements of the current file.
 
@@ -33,16 +219,10 @@ class TOCMixin:
         assert self.app.builder is not None
 
         toc_tree = TocTree(self.app.env)
-        raw_tree = toc_tree.get_toctree_for(
-            current_page_name, self.app.builder, True, maxdepth=-1
-        )
         local_toc_tree = toc_tree.get_toc_for(
             current_page_name, self.app.builder
         )
 
-        if raw_tree is None:
-            raw_tree = local_toc_tree
-
         # start with the bullets inside the doc's toc,
         # not the top level bullet, as we get that from the other tree
         if (
@@ -53,55 +233,18 @@ class TOCMixin:
         else:
             local_tree = local_toc_tree.children[0].children[1]
 
-        def _locate_nodes(nodes, level, outer=True):
-            # this is a lazy way of getting at all the info in a
-            # series of docutils nodes, with an absolute mimimal
-            # reliance on the actual structure of the nodes.
-            # we just look for refuris and the fact that a node
-            # is dependent on another somehow, that's it, then we
-            # flatten it out into a clean "tree" later.
-            # An official Sphinx feature/extension
-            # here would probably make much more use of direct
-            # knowledge of the structure
-
-            for elem in nodes:
-
-                if hasattr(elem, "attributes"):
-                    refuri = elem.attributes.get("refuri", None)
-                else:
-                    refuri = None
-
-                name = None
-                if refuri is not None:
-                    for index, sub_elem in enumerate(elem.children, 1):
-                        if isinstance(
-                            sub_elem,
-                            (docutils_nodes.Text, docutils_nodes.literal),
-                        ):
-                            continue
-                        else:
-                            break
-
-                    local_text = elem.children[0:index]
-                    name = str(local_text[0])
-                    remainders = elem.children[index:]
-
-                    yield level, refuri, name, local_text
-                else:
-                    remainders = elem.children
-
-                # try to embed the item-level get_toc_for() inside
-                # the file-level get_toctree_for(), otherwise if we
-                # just get the full get_toctree_for(), it's enormous.
-                if outer and refuri == "":
-                    if local_tree is not None:
-                        for ent in _locate_nodes(
-                            [local_tree], level + 1, False
-                        ):
-                            yield ent
-                else:
-                    for ent in _locate_nodes(remainders, level + 1, outer):
-                        yield ent
+        navigation_tree = self._get_navigation_tree()
+        if navigation_tree is not None:
+            located = self._locate_navigation_nodes(
+                navigation_tree, current_page_name, local_tree
+            )
+        else:
+            raw_tree = toc_tree.get_toctree_for(
+                current_page_name, self.app.builder, True, maxdepth=-1
+            )
+            if raw_tree is None:
+                raw_tree = local_toc_tree
+            located = self._locate_nodes([raw_tree], 0, local_tree)
 
         def _organize_nodes(nodes):
             """organize the nodes that we've grabbed with non-contiguous
@@ -158,9 +301,9 @@ class TOCMixin:
                         if not stack or isinstance(stack[0], tuple):
                             if printing:
                                 list_item = docutils_nodes.list_item(
-                                    classes=["selected"]
-                                    if not as_links
-                                    else []
+                                    classes=(
+                                        ["selected"] if not as_links else []
+                                    )
                                 )
                                 list_item.append(
                                     self._link_node(refuri, text_nodes)
@@ -171,9 +314,9 @@ class TOCMixin:
                         elif isinstance(stack[0], list):
                             if printing:
                                 list_item = docutils_nodes.list_item(
-                                    classes=["selected"]
-                                    if not as_links
-                                    else []
+                                    classes=(
+                                        ["selected"] if not as_links else []
+                                    )
                                 )
                                 list_item.append(
                                     self._link_node(refuri, text_nodes)
@@ -203,18 +346,137 @@ class TOCMixin:
 
         element = docutils_nodes.bullet_list()
 
-        nodes = _organize_nodes(_locate_nodes([raw_tree], 0))
+        nodes = _organize_nodes(located)
         _render_nodes(nodes, start_from=start_from, parent_element=element)
         return cast(StandaloneHTMLBuilder, self.app.builder).render_partial(
             element
         )["fragment"]
 
+    def reset_navigation_tree(self):
+        """Discard the cached global toctree, e.g. when the env changes."""
+        self._navigation_tree = None
+
+    def _get_navigation_tree(self):
+        """Return the global toctree resolved and flattened for this build.
+
+        Returns None if the cached tree can't be used, in which case
+        the toctree is resolved per page as Sphinx normally does.
+
+        """
+        if self._navigation_tree is None:
+            env = self.app.env
+            if any("tocdepth" in meta for meta in env.metadata.values()):
+                # per-document tocdepth prunes the collapsed tree differently
+                # than the full one; don't try to emulate that
+                self._navigation_tree = False
+            else:
+                raw_tree = TocTree(env).get_toctree_for(
+                    env.config.root_doc,
+                    _DocnameURIBuilder(self.app.builder),
+                    False,
+                    maxdepth=-1,
+                )
+                self._navigation_tree = (
+                    _NavigationTree(raw_tree, env.toctree_includes)
+                    if raw_tree is not None
+                    else False
+                )
+        return self._navigation_tree or None
+
+    def _locate_navigation_nodes(
+        self, navigation_tree, current_page_name, local_tree
+    ):
+        """Produce the same entries as :meth:`._locate_nodes` would for the
+        collapsed toctree of the given page, using the cached global tree.
+
+        """
+        builder = self.app.builder
+        for (
+            level,
+            internal,
+            docname,
+            anchorname,
+            reference,
+        ) in navigation_tree.visible_entries(current_page_name):
+            if internal:
+                refuri = (
+                    builder.get_relative_uri(current_page_name, docname)
+                    + anchorname
+                )
+            else:
+                refuri = docname
+
+            # the title nodes get modified and re-parented when rendered,
+            # so each page works with its own copy
+            name, local_text, remainders = _reference_text(
+                reference.deepcopy()
+            )
+            yield level, refuri, name, local_text
+
+            if refuri == "":
+                if local_tree is not None:
+                    for ent in self._locate_nodes(
+                        [local_tree], level + 1, local_tree, False
+                    ):
+                        yield ent
+            else:
+                for ent in self._locate_nodes(
+                    remainders, level + 1, local_tree
+                ):
+                    yield ent
+
+    def _locate_nodes(self, nodes, level, local_tree, outer=True):
+        # this is a lazy way of getting at all the info in a
+        # series of docutils nodes, with an absolute mimimal
+        # reliance on the actual structure of the nodes.
+        # we just look for refuris and the fact that a node
+        # is dependent on another somehow, that's it, then we
+        # flatten it out into a clean "tree" later.
+        # An official Sphinx feature/extension
+        # here would probably make much more use of direct
+        # knowledge of the structure
+
+        for elem in nodes:
+
+            if hasattr(elem, "attributes"):
+                refuri = elem.attributes.get("refuri", None)
+            else:
+                refuri = None
+
+            if refuri is not None:
+                name, local_text, remainders = _reference_text(elem)
+
+                yield level, refuri, name, local_text
+            else:
+                remainders = elem.children
+
+            # try to embed the item-level get_toc_for() inside
+            # the file-level get_toctree_for(), otherwise if we
+            # just get the full get_toctree_for(), it's enormous.
+            if outer and refuri == "":
+                if local_tree is not None:
+                    for ent in self._locate_nodes(
+                        [local_tree], level + 1, local_tree, False
+                    ):
+                        yield ent
+            else:
+                for ent in self._locate_nodes(
+                    remainders, level + 1, local_tree, outer
+                ):
+                    yield ent
+
     def get_local_toc(self, current_page_name, apply_exact_top_anchor=False):
         """Return the equivalent of Sphinx "toc" with options for rendering."""
 
         assert self.app.env is not None
         assert self.app.builder is not None
 
+        cache_key = self._local_toc_cache_key(current_page_name)
+        if cache_key is not None:
+            cached = self._load_local_toc(current_page_name, cache_key)
+            if apply_exact_top_anchor in cached["fragments"]:
+                return cached["fragments"][apply_exact_top_anchor]
+
         # local toc tree.  will be missing the actual anchor for top section
         toc_tree = TocTree(self.app.env)
         local_toc_tree = toc_tree.get_toc_for(
@@ -228,19 +490,18 @@ class TOCMixin:
         # from where you want to go.  The lead section of the content
         # has a real anchorname, so swap that into the toc
         if apply_exact_top_anchor:
-            # get that top anchor name from the ids
-            the_top_anchor = None
-            sections = list(
-                self.app.env.get_doctree(current_page_name).traverse(
-                    docutils_nodes.section
-                )
+            # get that top anchor name from the ids, as noted when the
+            # document was read
+            top_anchors = getattr(
+                self.app.env, "_zzzeeksphinx_top_anchors", {}
             )
-
-            if sections:
-                first_section = sections[0]
-
-                if first_section.attributes["ids"]:
-                    the_top_anchor = first_section.attributes["ids"][0]
+            if current_page_name in top_anchors:
+                the_top_anchor = top_anchors[current_page_name]
+            else:
+                # environment pickled before we were tracking these
+                the_top_anchor = _top_anchor(
+                    self.app.env.get_doctree(current_page_name)
+                )
 
             # have the top anchor and the toctree, put them together!
             if the_top_anchor:
@@ -253,9 +514,83 @@ class TOCMixin:
                         "refuri"
                     ] = f"#{the_top_anchor}"
 
-        return cast(StandaloneHTMLBuilder, self.app.builder).render_partial(
-            local_toc_tree
-        )["fragment"]
+        fragment = cast(
+            StandaloneHTMLBuilder, self.app.builder
+        ).render_partial(local_toc_tree)["fragment"]
+
+        if cache_key is not None:
+            cached["fragments"][apply_exact_top_anchor] = fragment
+            self._store_local_toc(current_page_name, cached)
+
+        return fragment
+
+    def _local_toc_cache_key(self, docname):
+        """Return the key under which the local toc of a page is cached.
+
+        The key covers what the rendered toc is made from: the page's
+        toc as recorded in the environment, its section numbers, which
+        can change without the page being read again, its top anchor,
+        and the html config hash, as for the rest of the page.  Returns
+        None if caching is disabled.
+
+        """
+        if not self.app.config.zzzeeksphinx_local_toc_cache:
+            return None
+        env = self.app.env
+        toc = env.tocs.get(docname)
+        if toc is None:
+            return None
+
+        builder = self.app.builder
+        build_info = getattr(builder, "build_info", None)
+        if build_info is not None:
+            config_hash = (build_info.config_hash, build_info.tags_hash)
+        else:
+            config_hash = (
+                getattr(builder, "config_hash", None),
+                getattr(builder, "tags_hash", None),
+            )
+
+        digest = hashlib.sha1(toc.pformat().encode("utf-8"))
+        digest.update(
+            repr(
+                (
+                    sorted(env.toc_secnumbers.get(docname, {}).items()),
+                    getattr(env, "_zzzeeksphinx_top_anchors", {}).get(docname),
+                )
+            ).encode("utf-8")
+        )
+        return (
+            __version__,
+            SPHINX_VERSION,
+            builder.name,
+            config_hash,
+            digest.hexdigest(),
+        )
+
+    def _load_local_toc(self, docname, cache_key):
+        try:
+            with open(
+                _local_toc_cache_path(self.app.doctreedir, docname), "rb"
+            ) as file_:
+                cached = pickle.load(file_)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            cached = None
+
+        # a changed key starts over; the file is then replaced as a whole
+        if cached is None or cached.get("key") != cache_key:
+            cached = {"key": cache_key, "fragments": {}}
+        return cached
+
+    def _store_local_toc(self, docname, cached):
+        # parallel writers each handle their own set of documents, so
+        # a file per document needs no coordination between processes
+        path = _local_toc_cache_path(self.app.doctreedir, docname)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp, "wb") as file_:
+            pickle.dump(cached, file_, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
 
     def _link_node(self, refuri, text_nodes):
         text_nodes = list(self._sub_out_underscores(text_nodes))
@@ -1,4 +1,8 @@
+import multiprocessing.util
+import os
+import pickle
 import re
+import shutil
 
 import sphinx
 
@@ -19,3 +23,67 @@ def go(m):
 
 def strip_toplevel_anchors(text):
     return re.compile(r"(\.html)?#[-\w]+-toplevel").sub(go, text)
+
+
+class ForkedProcessResults:
+    """Results that processes forked for a parallel build leave on disk,
+    for the main process to collect once the build is finished.
+
+    Forked writers don't hand anything back to the main process, and
+    they exit through ``os._exit()``, which skips atexit hooks;
+    multiprocessing still runs its own finalizers on the way out, so
+    each process writes its results from one of those.
+
+    """
+
+    def __init__(self, dirname):
+        # subdirectory of the doctree dir holding a file per process
+        self.dirname = dirname
+        self.directory = None
+        self.main_pid = None
+        self._registered_pid = None
+
+    def reset(self, app):
+        self.directory = os.path.join(app.doctreedir, self.dirname)
+        self.main_pid = os.getpid()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def in_forked_process(self):
+        return self.main_pid is not None and os.getpid() != self.main_pid
+
+    def write_on_exit(self, results):
+        """In a forked process, have ``results()`` written out as the
+        process exits; does nothing in the main process, or if this
+        process has done so already.
+
+        """
+        pid = os.getpid()
+        if not self.in_forked_process() or self._registered_pid == pid:
+            return
+        self._registered_pid = pid
+        multiprocessing.util.Finalize(
+            None, self._write, args=(results,), exitpriority=10
+        )
+
+    def _write(self, results):
+        data = results()
+        if data is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fname = os.path.join(self.directory, "%d.pickle" % os.getpid())
+        with open(fname + ".tmp", "wb") as file_:
+            pickle.dump(data, file_, pickle.HIGHEST_PROTOCOL)
+        os.replace(fname + ".tmp", fname)
+
+    def collect(self):
+        """Return what each forked process left, and remove it."""
+        collected = []
+        if self.directory is not None and os.path.isdir(self.directory):
+            for fname in sorted(os.listdir(self.directory)):
+                if fname.endswith(".pickle"):
+                    with open(
+                        os.path.join(self.directory, fname), "rb"
+                    ) as file_:
+                        collected.append(pickle.load(file_))
+            shutil.rmtree(self.directory, ignore_errors=True)
+        return collected
@@ -1,20 +1,43 @@
 import ast
+import concurrent.futures
+import functools
+import hashlib
 import importlib
+import multiprocessing
 import os
+import pickle
 import re
+import tokenize
 import warnings
 
 import docutils
 from docutils import nodes
 from docutils.parsers.rst import Directive
+import pygments
+import sphinx
+from sphinx.environment import CONFIG_OK
 from sphinx.errors import NoUri
 from sphinx.locale import _
 from sphinx.locale import __
 from sphinx.pycode import ModuleAnalyzer
+from sphinx.pycode import PycodeError
+from sphinx.util import logging
 from sphinx.util.display import status_iterator
+from sphinx.util.parallel import parallel_available
 
+from . import __version__
 from . import util
 
+LOG = logging.getLogger(__name__)
+
+# modname -> (key, highlighted HTML) from the last build, in the
+# doctree dir
+HIGHLIGHT_CACHE_FILE = "zzzeeksphinx_highlighted.pickle"
+
+# signatures of the module pages written by the last build, in the
+# doctree dir
+MODULE_PAGES_FILE = "zzzeeksphinx_module_pages.pickle"
+
 
 def view_source(name, rawtext, text, lineno, inliner, options={}, content=[]):
     env = inliner.document.settings.env
@@ -33,25 +56,55 @@ def vendored_collect_pages(app):
 
     modnames = set(env._viewcode_modules)  # type: ignore
 
-    for modname, entry in status_iterator(
-        sorted(env._viewcode_modules.items()),  # type: ignore
-        __("highlighting module code... "),
-        "blue",
-        len(env._viewcode_modules),  # type: ignore
-        app.verbosity,
-        lambda x: x[0],
+    if env.config.highlight_language in ("python3", "default", "none"):
+        lexer = env.config.highlight_language
+    else:
+        lexer = "python"
+
+    sources = []
+    for modname, entry in sorted(
+        env._viewcode_modules.items()  # type: ignore
     ):
         if not entry:
             continue
-        code, tags, used, refname = entry
+        pathname, mtime, digest, tags, used, refname = entry
+        try:
+            code, tags = _entry_source(modname, pathname, mtime, digest, tags)
+        except PycodeError as err:
+            LOG.warning(
+                "can't read the source of %s, not writing its page: %s",
+                modname,
+                err,
+            )
+            modnames.discard(modname)
+            continue
+        sources.append(
+            (modname, code, tags, used, refname, _highlight_key(code, lexer))
+        )
+
+    # highlight the source using the builder's highlighter, for those
+    # modules that weren't highlighted by an earlier build
+    previous = _load_state(app, HIGHLIGHT_CACHE_FILE)
+    highlighted_modules = _highlight_modules(
+        app,
+        highlighter,
+        [
+            (modname, code, lexer)
+            for modname, code, tags, used, refname, key in sources
+            if previous.get(modname, (None,))[0] != key
+        ],
+    )
+    kept = {}
+    pages = _ModulePages(app)
+
+    for modname, code, tags, used, refname, key in sources:
+        if modname in highlighted_modules:
+            highlighted = highlighted_modules[modname]
+        else:
+            highlighted = previous[modname][1]
+        kept[modname] = key, highlighted
         # construct a page name for the highlighted source
         pagename = "_modules/" + modname.replace(".", "/")
-        # highlight the source using the builder's highlighter
-        if env.config.highlight_language in ("python3", "default", "none"):
-            lexer = env.config.highlight_language
-        else:
-            lexer = "python"
-        highlighted = highlighter.highlight_block(code, lexer, linenos=False)
         # split the code into lines
         lines = highlighted.splitlines()
         # split off wrap markup from the first line of the actual code
@@ -100,9 +153,13 @@ def vendored_collect_pages(app):
                 _("<h1>Source code for %s</h1>") % modname + "\n".join(lines)
             ),
         }
-        yield (pagename, context, "page.html")
+        if pages.changed(pagename, context, "page.html"):
+            yield (pagename, context, "page.html")
+
+    _save_state(app, HIGHLIGHT_CACHE_FILE, kept)
 
     if not modnames:
+        pages.save()
         return
 
     html = ["\n"]
@@ -136,7 +193,173 @@ def vendored_collect_pages(app):
         ),
     }
 
-    yield ("_modules/index", context, "page.html")
+    if pages.changed("_modules/index", context, "page.html"):
+        yield ("_modules/index", context, "page.html")
+
+    pages.save()
+
+
+def _highlight_key(code, lexer):
+    # what the highlighted HTML depends on
+    return _digest(code), lexer, pygments.__version__, sphinx.__version__
+
+
+def _load_state(app, filename):
+    fname = os.path.join(app.doctreedir, filename)
+    try:
+        with open(fname, "rb") as file_:
+            return pickle.load(file_)
+    except Exception:
+        # not there yet, or not readable by this version
+        return {}
+
+
+def _save_state(app, filename, data):
+    fname = os.path.join(app.doctreedir, filename)
+    with open(fname + ".tmp", "wb") as file_:
+        pickle.dump(data, file_, pickle.HIGHEST_PROTOCOL)
+    os.replace(fname + ".tmp", fname)
+
+
+def _page_globals(app):
+    # what the module pages depend on besides their own context
+    build_info = getattr(app.builder, "build_info", None)
+    return (
+        getattr(build_info, "config_hash", None),
+        getattr(build_info, "tags_hash", None),
+        app.builder.templates.newest_template_mtime(),
+        # fingerprinted static asset names the pages link to
+        sorted(
+            app.config.html_context.get(
+                "zzzeeksphinx_static_assets", {}
+            ).items()
+        ),
+        __version__,
+        sphinx.__version__,
+    )
+
+
+def note_config_status(app):
+    # sphinx resets this once the documents are read
+    app._builder_config_changed = app.env.config_status != CONFIG_OK
+
+
+class _ModulePages:
+    """Signatures of the module source pages written by the last
+    build, so that pages which would come out the same are left as
+    they are.
+
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.globals = _page_globals(app)
+
+        state = _load_state(app, MODULE_PAGES_FILE)
+        if (
+            app.config.zzzeeksphinx_skip_unchanged_module_pages
+            and not app._builder_config_changed
+            and state.get("globals") == self.globals
+        ):
+            self.previous = state["pages"]
+        else:
+            self.previous = {}
+
+        # pagename -> signature, for every page of this build
+        self.pages = {}
+        self.skipped = 0
+
+    def changed(self, pagename, context, template):
+        signature = hashlib.sha1(
+            repr((template, context)).encode("utf-8")
+        ).hexdigest()
+        self.pages[pagename] = signature
+
+        if self.previous.get(pagename) == signature and os.path.exists(
+            self.app.builder.get_outfilename(pagename)
+        ):
+            self.skipped += 1
+            return False
+        return True
+
+    def save(self):
+        _save_state(
+            self.app,
+            MODULE_PAGES_FILE,
+            {"globals": self.globals, "pages": self.pages},
+        )
+        if self.skipped:
+            LOG.info(
+                "%d unchanged module source pages not written again",
+                self.skipped,
+            )
+
+
+# the highlighter, in a process highlighting modules for the main one
+_worker_highlighter = None
+
+
+def _init_highlight_worker(highlighter):
+    global _worker_highlighter
+    _worker_highlighter = highlighter
+
+
+def _highlight_in_worker(item):
+    code, lexer = item
+    return _worker_highlighter.highlight_block(code, lexer, linenos=False)
+
+
+def _highlight_modules(app, highlighter, pending):
+    """Highlight a list of (modname, code, lexer), returning a dict of
+    modname -> HTML.
+
+    With more than one process configured, the modules are highlighted
+    by a pool of forked processes; the results are the same either way.
+
+    """
+    processes = app.config.zzzeeksphinx_highlight_processes
+    if not processes:
+        processes = app.parallel
+    processes = min(processes, len(pending))
+
+    if processes > 1 and parallel_available:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_highlight_worker,
+            initargs=(highlighter,),
+        ) as executor:
+            return _gather_highlighted(
+                app,
+                pending,
+                executor.map(
+                    _highlight_in_worker,
+                    [(code, lexer) for modname, code, lexer in pending],
+                ),
+            )
+    else:
+        return _gather_highlighted(
+            app,
+            pending,
+            (
+                highlighter.highlight_block(code, lexer, linenos=False)
+                for modname, code, lexer in pending
+            ),
+        )
+
+
+def _gather_highlighted(app, pending, results):
+    highlighted = {}
+    for (modname, code, lexer), html in status_iterator(
+        zip(pending, results),
+        __("highlighting module code... "),
+        "blue",
+        len(pending),
+        app.verbosity,
+        lambda x: x[0][0],
+    ):
+        highlighted[modname] = html
+    return highlighted
 
 
 def vendored_env_merge_info(app, env, docnames, other):
@@ -176,39 +399,26 @@ def _get_module_docstring(_file):
         return None
 
 
-def _view_source_node(env, text, state):
-    # pretend we're using viewcode fully,
-    # install the context it looks for
-    if not hasattr(env, "_viewcode_modules"):
-        env._viewcode_modules = {}
+def _resolve_module(modname, package=None):
+    """Return the (pathname, origin) of a module.
 
-    modname = text
-    text = modname.split(".")[-1] + ".py"
-
-    # imitate sphinx .<modname> syntax
-    if modname.startswith("."):
-        # see if the modname needs to be corrected in terms
-        # of current module context
-
-        base_module = _get_sphinx_py_module(env)
-        if base_module:
-            modname = base_module + modname
-        else:
-            warnings.warn(
-                "Could not get base module for relative module: %s; "
-                "not generating node" % modname
-            )
-            return None
-
-    urito = env.app.builder.get_relative_uri
+    ``package`` is the already resolved (pathname, origin) of the
+    module's package, if there is one, so that siblings can share
+    the lookup.
 
+    """
     # we're showing code examples which may have dependencies
     # which we really don't want to have required so load the
     # module by file, not import (though we are importing)
     # the top level module here...
-    pathname = module_docstring = None
+    if package is not None:
+        pathname, origin = package
+        tokens = [modname.rsplit(".", 1)[-1]]
+    else:
+        pathname = origin = None
+        tokens = modname.split(".")
 
-    for tok in modname.split("."):
+    for tok in tokens:
         try:
             thing = importlib.machinery.PathFinder().find_spec(
                 tok,
@@ -223,23 +433,191 @@ def _view_source_node(env, text, state):
                 else thing.origin
             )
             if thing.origin:
-                assert thing.origin
+                origin = thing.origin
+
+    return pathname, origin
+
+
+def _read_code(pathname):
+    # as ModuleAnalyzer.for_file() reads it; its cache isn't used, as
+    # that doesn't notice changes to the file
+    try:
+        with tokenize.open(pathname) as file_:
+            return file_.read()
+    except Exception as err:
+        raise PycodeError("error opening %r" % pathname, err) from err
 
-                with open(thing.origin, "r") as tfile:
-                    if state:
-                        module_docstring = _get_module_docstring(tfile)
 
-    # unlike viewcode which silently traps exceptions,
-    # I want this to totally barf if the file can't be loaded.
-    # a failed build better than a complete build missing
-    # key content
-    analyzer = ModuleAnalyzer.for_file(pathname, modname)
+def _analyze(modname, pathname, code):
+    analyzer = ModuleAnalyzer(code, modname, pathname)
     # copied from viewcode
     analyzer.find_tags()
     if not isinstance(analyzer.code, str):
         code = analyzer.code.decode(analyzer.encoding)
     else:
         code = analyzer.code
+    return code, analyzer.tags
+
+
+def _digest(code):
+    return hashlib.sha1(code.encode("utf-8")).hexdigest()
+
+
+class _ModuleSource:
+    """A module's file, along with the code, tags and docstring that
+    _view_source_node() takes from it.
+
+    """
+
+    def __init__(self, modname, pathname, origin):
+        self.pathname = pathname
+        # the file the docstring is read from
+        self.origin = origin
+        # taken before reading, so that a change while reading is noticed
+        self.mtimes = self.current_mtimes()
+
+        # unlike viewcode which silently traps exceptions,
+        # I want this to totally barf if the file can't be loaded.
+        # a failed build better than a complete build missing
+        # key content
+        self.code, self.tags = _analyze(
+            modname, pathname, _read_code(pathname)
+        )
+        self.digest = _digest(self.code)
+
+    def current_mtimes(self):
+        return (
+            os.stat(self.pathname).st_mtime_ns,
+            os.stat(self.origin).st_mtime_ns if self.origin else None,
+        )
+
+    @functools.cached_property
+    def docstring(self):
+        if not self.origin:
+            return None
+        with open(self.origin, "r") as tfile:
+            return _get_module_docstring(tfile)
+
+
+# modname -> _ModuleSource, kept for this process for as long as the
+# files are unchanged, so that a module referred to from many documents
+# is resolved and parsed once
+_module_sources = {}
+
+
+def _current_module_source(modname):
+    source = _module_sources.get(modname)
+    if source is not None:
+        try:
+            if source.current_mtimes() == source.mtimes:
+                return source
+        except OSError:
+            # moved or removed; resolve it again
+            pass
+    return None
+
+
+def _module_source(modname):
+    source = _current_module_source(modname)
+    if source is None:
+        source = _module_sources[modname] = _ModuleSource(
+            modname, *_resolve_module(modname)
+        )
+    return source
+
+
+def _load_module_sources(modnames):
+    """Bring _module_sources up to date for a group of modules, looking
+    up each package they're in once rather than for every module.
+
+    """
+    packages = {}
+    for modname in modnames:
+        if _current_module_source(modname) is not None:
+            continue
+        package = modname.rpartition(".")[0]
+        if package and package not in packages:
+            packages[package] = _resolve_module(package)
+        _module_sources[modname] = _ModuleSource(
+            modname, *_resolve_module(modname, packages.get(package))
+        )
+
+
+# directory -> (mtime, sorted listing of the modules autosource shows)
+_directory_listings = {}
+
+
+def _list_source_files(dir_):
+    # the directory's mtime changes when files are added or removed
+    mtime = os.stat(dir_).st_mtime_ns
+    listing = _directory_listings.get(dir_)
+    if listing is None or listing[0] != mtime:
+        listing = _directory_listings[dir_] = (
+            mtime,
+            tuple(
+                sorted(
+                    f
+                    for f in os.listdir(dir_)
+                    if f.endswith(".py") and f != "__init__.py"
+                )
+            ),
+        )
+    return listing[1]
+
+
+def _entry_source(modname, pathname, mtime, digest, tags):
+    """Code and tags for a _viewcode_modules entry, which has only the
+    file's path, mtime and hash of what was read.
+
+    """
+    source = _module_sources.get(modname)
+    if source is not None and (source.pathname, source.digest) == (
+        pathname,
+        digest,
+    ):
+        try:
+            if source.current_mtimes() == source.mtimes:
+                return source.code, tags
+        except OSError:
+            pass
+
+    code = _read_code(pathname)
+    if os.stat(pathname).st_mtime_ns != mtime and _digest(code) != digest:
+        LOG.info(
+            "%s has changed since it was read; showing its current source",
+            pathname,
+        )
+        return _analyze(modname, pathname, code)
+    return code, tags
+
+
+def _view_source_node(env, text, state):
+    # pretend we're using viewcode fully,
+    # install the context it looks for
+    if not hasattr(env, "_viewcode_modules"):
+        env._viewcode_modules = {}
+
+    modname = text
+    text = modname.split(".")[-1] + ".py"
+
+    # imitate sphinx .<modname> syntax
+    if modname.startswith("."):
+        # see if the modname needs to be corrected in terms
+        # of current module context
+
+        base_module = _get_sphinx_py_module(env)
+        if base_module:
+            modname = base_module + modname
+        else:
+            warnings.warn(
+                "Could not get base module for relative module: %s; "
+                "not generating node" % modname
+            )
+            return None
+
+    urito = env.app.builder.get_relative_uri
+
+    source = _module_source(modname)
 
     pagename = "_modules/" + modname.replace(".", "/")
     try:
@@ -249,10 +627,13 @@ def _view_source_node(env, text, state):
         # to be what we get
         refuri = None
 
+    # the code itself is read again when the page is written, rather
+    # than kept in the pickled environment
+    mtime = source.mtimes[0]
     if util.SPHINX_VERSION >= (1, 3):
-        entry = code, analyzer.tags, {}, refuri
+        entry = source.pathname, mtime, source.digest, source.tags, {}, refuri
     else:
-        entry = code, analyzer.tags, {}
+        entry = source.pathname, mtime, source.digest, source.tags, {}
     env._viewcode_modules[modname] = entry
 
     if refuri:
@@ -263,7 +644,8 @@ def _view_source_node(env, text, state):
         refnode = nodes.Text(text, text)
 
     # get the first line of the module docstring
-    if module_docstring and state:
+    module_docstring = source.docstring if state else None
+    if module_docstring:
         firstline = module_docstring.lstrip().split("\n\n")[0]
         if 30 < len(firstline) < 450:  # opinionated
             description_node = nodes.paragraph("", "")
@@ -317,20 +699,28 @@ class AutoSourceDirective(Directive):
 
         sourcefile = self.state.document.current_source.split(os.pathsep)[0]
         dir_ = os.path.dirname(sourcefile)
-        files = sorted(
-            f
-            for f in os.listdir(dir_)
-            if f.endswith(".py") and f != "__init__.py"
-        )
+        files = _list_source_files(dir_)
 
         if "files" in content:
             # ordered listing of files to include
+            present = set(files)
             files = [
                 fname
                 for fname in _comma_list(content["files"])
-                if fname in set(files)
+                if fname in present
             ]
 
+        # resolve and read the modules together, so that their package
+        # is looked up once
+        base_module = _get_sphinx_py_module(env)
+        if base_module:
+            _load_module_sources(
+                [
+                    base_module + "." + os.path.splitext(fname)[0]
+                    for fname in files
+                ]
+            )
+
         node = nodes.paragraph(
             "", "", nodes.Text("Listing of files:", "Listing of files:")
         )
@@ -358,3 +748,7 @@ def setup(app):
 
     app.connect("env-merge-info", vendored_env_merge_info)
     app.connect("html-collect-pages", vendored_collect_pages)
+    app.connect("builder-inited", note_config_status)
+    # processes highlighting module source pages; 0 follows -j
+    app.add_config_value("zzzeeksphinx_highlight_processes", 0, "")
+    app.add_config_value("zzzeeksphinx_skip_unchanged_module_pages", True, "")